@@ -69,7 +69,7 @@ export default function Flog() {
 
   useEffect(() => {
     // Fetch articles from API
-    fetch(`${API_BASE}/api/flog/articles`)
+    fetch(`${API_BASE}/api/flog/articles?view=summary`)
       .then(res => res.json())
       .then(data => {
         if (data.ok && data.articles.length > 0) {
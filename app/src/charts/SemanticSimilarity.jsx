@@ -1,8 +1,29 @@
-import { useEffect, useRef } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import * as d3 from 'd3'
 
+const API_BASE = import.meta.env.VITE_API_BASE || 'http://localhost:8001'
+
+// Shown until (or if) the analysis API responds
+const FALLBACK_PAIRS = [
+  { source: 'Peterson', target: 'Breivik', similarity: 16 },
+  { source: 'Peterson', target: 'Marx', similarity: 45 },
+  { source: 'Breivik', target: 'Marx', similarity: 38 }
+]
+
 export default function SemanticSimilarity() {
   const svgRef = useRef()
+  const [data, setData] = useState(FALLBACK_PAIRS)
+
+  useEffect(() => {
+    fetch(`${API_BASE}/api/analysis/similarity`)
+      .then(res => res.json())
+      .then(result => {
+        if (result.ok && result.pairs.length > 0) {
+          setData(result.pairs)
+        }
+      })
+      .catch(() => {})
+  }, [])
 
   useEffect(() => {
     const width = 600
@@ -14,18 +35,9 @@ export default function SemanticSimilarity() {
     // Clear previous content
     svg.selectAll('*').remove()
 
-    const data = [
-      { source: 'Peterson', target: 'Breivik', similarity: 16 },
-      { source: 'Peterson', target: 'Marx', similarity: 45 },
-      { source: 'Breivik', target: 'Marx', similarity: 38 }
-    ]
-
     // Create force simulation
-    const nodes = [
-      { id: 'Peterson', group: 1 },
-      { id: 'Breivik', group: 2 },
-      { id: 'Marx', group: 3 }
-    ]
+    const ids = [...new Set(data.flatMap(d => [d.source, d.target]))]
+    const nodes = ids.map((id, i) => ({ id, group: (i % 3) + 1 }))
 
     const links = data.map(d => ({
       source: d.source,
@@ -101,7 +113,7 @@ export default function SemanticSimilarity() {
     })
 
     return () => simulation.stop()
-  }, [])
+  }, [data])
 
   return (
     <div className="chart-container">
@@ -1,8 +1,31 @@
-import { useEffect, useRef } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import * as d3 from 'd3'
 
+const API_BASE = import.meta.env.VITE_API_BASE || 'http://localhost:8001'
+
+// Shown until (or if) the analysis API responds
+const FALLBACK_THEMES = [
+  { theme: 'Identity Politics', overlap: 85 },
+  { theme: 'Cultural Marxism', overlap: 78 },
+  { theme: 'Frankfurt School', overlap: 72 },
+  { theme: 'Social Order', overlap: 68 },
+  { theme: 'Western Values', overlap: 65 }
+]
+
 export default function ThematicOverlap() {
   const svgRef = useRef()
+  const [data, setData] = useState(FALLBACK_THEMES)
+
+  useEffect(() => {
+    fetch(`${API_BASE}/api/analysis/topics?a=Peterson&b=Breivik`)
+      .then(res => res.json())
+      .then(result => {
+        if (result.ok && result.themes.length > 0) {
+          setData(result.themes.map(t => ({ theme: t.theme, overlap: Math.round(t.overlap) })))
+        }
+      })
+      .catch(() => {})
+  }, [])
 
   useEffect(() => {
     const width = 600
@@ -15,14 +38,6 @@ export default function ThematicOverlap() {
 
     svg.selectAll('*').remove()
 
-    const data = [
-      { theme: 'Identity Politics', overlap: 85 },
-      { theme: 'Cultural Marxism', overlap: 78 },
-      { theme: 'Frankfurt School', overlap: 72 },
-      { theme: 'Social Order', overlap: 68 },
-      { theme: 'Western Values', overlap: 65 }
-    ]
-
     const x = d3.scaleBand()
       .domain(data.map(d => d.theme))
       .range([margin.left, width - margin.right])
@@ -85,7 +100,7 @@ export default function ThematicOverlap() {
       .delay((d, i) => 1000 + i * 100)
       .attr('opacity', 1)
 
-  }, [])
+  }, [data])
 
   return (
     <div className="chart-container">
@@ -0,0 +1,21 @@
+"""
+Admin authentication shared by backend blueprints.
+"""
+import hmac
+import os
+
+from flask import request, jsonify
+
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
+
+
+def require_admin():
+    """
+    Return an error response unless the X-Admin-Key header carries the admin
+    key. Not accepted as a query parameter, which would end up in access logs.
+    """
+    key = request.headers.get("X-Admin-Key", "")
+    # Bytes, as compare_digest() rejects non-ASCII str
+    if not ADMIN_API_KEY or not hmac.compare_digest(key.encode("utf-8"), ADMIN_API_KEY.encode("utf-8")):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return None
@@ -0,0 +1,144 @@
+"""
+Admission control for the events API.
+
+/api/authz is Traefik's forwardAuth for the book, lab and app, and
+/api/auth/* signs users in; when those queue behind Flog traffic or an email
+batch, paid content looks down. Each worker therefore sheds low-priority
+requests early, with 503 + Retry-After, to keep threads free for them:
+
+- critical routes (ADMISSION_CRITICAL prefixes, default /api/authz,
+  /api/auth/, /healthz, /metrics) are always admitted
+- other requests are refused while the worker already has
+  ADMISSION_MAX_INFLIGHT requests in flight (default: GUNICORN_THREADS minus
+  ADMISSION_RESERVED, i.e. some threads are kept for critical routes)
+- per-route limits cap heavy prefixes on their own, e.g.
+  ADMISSION_ROUTE_LIMITS="/api/flog=4,/api/analysis=2,/api/email=4"
+- requests that already waited longer than ADMISSION_MAX_QUEUE_MS before
+  reaching a worker are refused; the wait is measured from the proxy's
+  X-Request-Start header ("t=<unix ms>", set in the Caddyfile)
+
+Limits are per worker process; Prometheus sums them across workers.
+"""
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+from prometheus_client import Counter, Gauge, Histogram
+
+THREADS = int(os.environ.get("GUNICORN_THREADS", "8"))
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_CRITICAL = tuple(
+    p.strip() for p in os.environ.get("ADMISSION_CRITICAL", "/api/authz,/api/auth/,/healthz,/metrics").split(",")
+    if p.strip()
+)
+ADMISSION_RESERVED = int(os.environ.get("ADMISSION_RESERVED", "2"))
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("ADMISSION_MAX_INFLIGHT", str(max(THREADS - ADMISSION_RESERVED, 1))))
+ADMISSION_ROUTE_LIMITS = {
+    prefix.strip(): int(limit)
+    for prefix, _, limit in (
+        item.partition("=") for item in
+        os.environ.get("ADMISSION_ROUTE_LIMITS", "/api/flog=4,/api/analysis=2,/api/email=4").split(",")
+        if "=" in item
+    )
+}
+ADMISSION_MAX_QUEUE_MS = float(os.environ.get("ADMISSION_MAX_QUEUE_MS", "1000"))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "2"))
+
+IN_FLIGHT = Gauge(
+    "admission_in_flight", "Requests being served, by priority",
+    ["priority"], multiprocess_mode="livesum",
+)
+REJECTED = Counter("admission_rejected_total", "Requests shed with 503", ["priority", "route", "reason"])
+QUEUE_WAIT = Histogram(
+    "request_queue_wait_seconds", "Time from the proxy's X-Request-Start to a worker picking the request up",
+    ["priority"],
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+
+_lock = threading.Lock()
+_in_flight = 0
+_by_route = {prefix: 0 for prefix in ADMISSION_ROUTE_LIMITS}
+
+
+def _priority(path: str) -> str:
+    return "critical" if path.startswith(ADMISSION_CRITICAL) else "normal"
+
+
+def _route_prefix(path: str) -> str | None:
+    matches = [p for p in ADMISSION_ROUTE_LIMITS if path.startswith(p)]
+    return max(matches, key=len) if matches else None
+
+
+def queue_wait(header: str | None) -> float | None:
+    """Seconds since X-Request-Start ("t=<unix s|ms|us>" or a bare number), or None"""
+    if not header:
+        return None
+    try:
+        value = float(header.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    # Accept seconds, milliseconds or microseconds, as proxies differ
+    while value > 1e11:
+        value /= 1000
+    return max(time.time() - value, 0.0)
+
+
+def _admit(priority, prefix, wait):
+    """None if admitted (and counted), else the reason for refusing"""
+    global _in_flight
+    if priority != "critical" and wait is not None and wait * 1000 > ADMISSION_MAX_QUEUE_MS:
+        return "queue_wait"
+    with _lock:
+        if priority != "critical":
+            if _in_flight >= ADMISSION_MAX_INFLIGHT:
+                return "in_flight"
+            if prefix is not None and _by_route[prefix] >= ADMISSION_ROUTE_LIMITS[prefix]:
+                return "route_limit"
+        _in_flight += 1
+        if prefix is not None:
+            _by_route[prefix] += 1
+    return None
+
+
+def _release(prefix):
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+        if prefix is not None:
+            _by_route[prefix] -= 1
+
+
+def init_app(app):
+    """
+    Call right after metrics.init_app(): shed requests skip the profiling,
+    query and tracing hooks but are still counted in http_requests_total
+    """
+    if not ADMISSION_ENABLED:
+        return
+
+    @app.before_request
+    def _admission_check():
+        priority = _priority(request.path)
+        prefix = _route_prefix(request.path)
+        wait = queue_wait(request.headers.get("X-Request-Start"))
+        if wait is not None:
+            QUEUE_WAIT.labels(priority).observe(wait)
+        reason = _admit(priority, prefix, wait)
+        if reason is not None:
+            route = prefix or (request.url_rule.rule if request.url_rule else "unmatched")
+            REJECTED.labels(priority, route, reason).inc()
+            resp = jsonify({"ok": False, "error": "server busy, retry shortly"})
+            resp.status_code = 503
+            resp.headers["Retry-After"] = str(ADMISSION_RETRY_AFTER)
+            return resp
+        g._admission = (priority, prefix)
+        IN_FLIGHT.labels(priority).inc()
+
+    @app.teardown_request
+    def _admission_release(exc):
+        admitted = g.pop("_admission", None)
+        if admitted is not None:
+            priority, prefix = admitted
+            _release(prefix)
+            IN_FLIGHT.labels(priority).dec()
@@ -0,0 +1,241 @@
+"""
+Text analysis API: document similarity and topic overlap over a corpus.
+
+A corpus is a directory of .txt/.md files under ANALYSIS_CORPUS_ROOT
+(one document per file, labelled by file name, e.g. corpus/default/Peterson.txt).
+Results are cached by a hash of the corpus contents, in-process (a small LRU)
+and in Redis, so the charts get numbers without recomputation until a file
+changes.
+
+No corpus ships with the repo: the texts are not ours to redistribute. Mount
+one at ANALYSIS_CORPUS_ROOT; until then both endpoints answer 503 saying so.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from flask import Blueprint, request, jsonify
+
+from flog_api import cors
+from metrics import TimedRedis, cache_result
+from text_analysis import iter_tokens, term_counts, tfidf, cosine_matrix, nmf
+
+analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+CORPUS_ROOT = Path(os.environ.get("ANALYSIS_CORPUS_ROOT", Path(__file__).parent / "corpus")).resolve()
+CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+CORPUS_SUFFIXES = (".txt", ".md")
+# Bounds for the in-process caches; Redis keeps everything for CACHE_TTL
+LOCAL_RESULTS_MAX = int(os.environ.get("ANALYSIS_LOCAL_CACHE_MAX", "64"))
+FILE_DIGESTS_MAX = int(os.environ.get("ANALYSIS_DIGEST_CACHE_MAX", "4096"))
+
+r = TimedRedis.from_url(REDIS_URL)
+
+# result cache key -> result dict, least recently used first
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+
+class CorpusMissing(Exception):
+    """No corpus at all under ANALYSIS_CORPUS_ROOT: a deployment problem, not a bad request"""
+
+
+def _has_corpus() -> bool:
+    return CORPUS_ROOT.is_dir() and any(p.is_dir() for p in CORPUS_ROOT.iterdir())
+
+
+if not _has_corpus():
+    print(f"analysis_api: no corpus under {CORPUS_ROOT}; /api/analysis answers 503 until one is mounted", flush=True)
+
+
+def _corpus_files(name: str):
+    if not _has_corpus():
+        raise CorpusMissing(
+            f"no analysis corpus installed: add <corpus>/<document>.txt files under {CORPUS_ROOT} "
+            "or point ANALYSIS_CORPUS_ROOT at them"
+        )
+    directory = (CORPUS_ROOT / name).resolve()
+    if CORPUS_ROOT not in directory.parents or not directory.is_dir():
+        raise FileNotFoundError(f"corpus '{name}' not found")
+    files = sorted(p for p in directory.iterdir() if p.suffix in CORPUS_SUFFIXES and p.is_file())
+    if len(files) < 2:
+        raise FileNotFoundError(f"corpus '{name}' needs at least two documents")
+    return files
+
+
+@lru_cache(maxsize=FILE_DIGESTS_MAX)
+def _digest(path: str, size: int, mtime_ns: int) -> str:
+    """sha256 of a file; keyed on size and mtime so unchanged files are not re-read"""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _file_digest(path: Path) -> str:
+    st = path.stat()
+    return _digest(str(path), st.st_size, st.st_mtime_ns)
+
+
+def _local_get(key: str):
+    with _results_lock:
+        result = _results.get(key)
+        if result is not None:
+            _results.move_to_end(key)
+        return result
+
+
+def _local_put(key: str, result):
+    with _results_lock:
+        _results[key] = result
+        _results.move_to_end(key)
+        while len(_results) > LOCAL_RESULTS_MAX:
+            _results.popitem(last=False)
+
+
+def corpus_hash(files) -> str:
+    h = hashlib.sha256()
+    for path in files:
+        h.update(f"{path.stem}\0{_file_digest(path)}\0".encode())
+    return h.hexdigest()
+
+
+def _cached(key: str, compute):
+    result = _local_get(key)
+    if result is not None:
+        cache_result("analysis", "local")
+        return result
+    try:
+        raw = r.get(f"analysis:{key}")
+        if raw:
+            cache_result("analysis", "redis")
+            result = json.loads(raw)
+            _local_put(key, result)
+            return result
+    except Exception:
+        pass
+    cache_result("analysis", "miss")
+    result = compute()
+    _local_put(key, result)
+    try:
+        r.setex(f"analysis:{key}", CACHE_TTL, json.dumps(result))
+    except Exception:
+        pass
+    return result
+
+
+def _vectorize(files):
+    def docs():
+        for path in files:
+            with open(path, encoding="utf-8", errors="replace") as fh:
+                yield iter_tokens(fh)
+    counts, vocabulary = term_counts(docs())
+    terms = np.empty(len(vocabulary), dtype=object)
+    for term, col in vocabulary.items():
+        terms[col] = term
+    return tfidf(counts), terms
+
+
+def compute_similarity(files) -> dict:
+    matrix, _ = _vectorize(files)
+    sims = cosine_matrix(matrix)
+    labels = [p.stem for p in files]
+    return {
+        "documents": labels,
+        "pairs": [
+            {"source": labels[i], "target": labels[j], "similarity": round(float(sims[i, j]) * 100, 1)}
+            for i in range(len(labels))
+            for j in range(i + 1, len(labels))
+        ],
+    }
+
+
+def compute_topics(files, n_topics: int, n_terms: int = 3) -> dict:
+    matrix, terms = _vectorize(files)
+    W, H = nmf(matrix, n_topics)
+    shares = W / np.maximum(W.sum(axis=1, keepdims=True), 1e-12)
+    return {
+        "documents": [p.stem for p in files],
+        "topics": [
+            {
+                "terms": [str(t) for t in terms[np.argsort(-H[t])[:n_terms]]],
+                "shares": [round(float(s), 4) for s in shares[:, t]],
+            }
+            for t in range(n_topics)
+        ],
+    }
+
+
+@analysis_bp.route('/similarity', methods=['GET'])
+def similarity():
+    """
+    GET /api/analysis/similarity?corpus=default
+    Pairwise TF-IDF cosine similarity (percent) between corpus documents.
+    """
+    try:
+        files = _corpus_files(request.args.get('corpus', 'default'))
+        key = f"similarity:{corpus_hash(files)}"
+        result = _cached(key, lambda: compute_similarity(files))
+        return cors(jsonify({"ok": True, **result}))
+    except CorpusMissing as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 503))
+    except FileNotFoundError as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 404))
+    except Exception as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 500))
+
+
+@analysis_bp.route('/topics', methods=['GET'])
+def topics():
+    """
+    GET /api/analysis/topics?corpus=default&a=Peterson&b=Breivik&topics=5
+    Topic model (NMF over TF-IDF) of the corpus, reported as per-topic
+    overlap between documents a and b: 100 * min(share) / max(share).
+    """
+    try:
+        files = _corpus_files(request.args.get('corpus', 'default'))
+        try:
+            n_topics = max(2, min(int(request.args.get('topics', 5)), 20))
+        except ValueError:
+            return cors((jsonify({"ok": False, "error": "topics must be an integer"}), 400))
+        key = f"topics:{n_topics}:{corpus_hash(files)}"
+        model = _cached(key, lambda: compute_topics(files, n_topics))
+
+        labels = model["documents"]
+        a = request.args.get('a', labels[0])
+        b = request.args.get('b', labels[1])
+        if a not in labels or b not in labels:
+            return cors((jsonify({"ok": False, "error": "a and b must be corpus documents"}), 400))
+        ia, ib = labels.index(a), labels.index(b)
+
+        themes = []
+        for topic in model["topics"]:
+            sa, sb = topic["shares"][ia], topic["shares"][ib]
+            themes.append({
+                "theme": " / ".join(topic["terms"]),
+                "terms": topic["terms"],
+                "overlap": round(100 * min(sa, sb) / max(sa, sb), 1) if max(sa, sb) > 0 else 0.0,
+                "weight": round(sa + sb, 4),
+            })
+        themes.sort(key=lambda t: -t["weight"])
+
+        return cors(jsonify({
+            "ok": True,
+            "a": a,
+            "b": b,
+            "overall": round(100 * sum(min(t["shares"][ia], t["shares"][ib]) for t in model["topics"]), 1),
+            "themes": themes,
+        }))
+    except CorpusMissing as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 503))
+    except FileNotFoundError as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 404))
+    except Exception as e:
+        return cors((jsonify({"ok": False, "error": str(e)}), 500))
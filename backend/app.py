@@ -5,20 +5,35 @@ import json
 from datetime import datetime, timezone
 
 from flask import Flask, request, jsonify, make_response, redirect, render_template
-import redis
 from rq import Queue
-from tou_api import tou_bp
+from tou_api import tou_bp, has_accepted_active
 from flog_api import flog_bp
 from email_api import email_bp
+from analysis_api import analysis_bp
+from license_api import license_bp, PROVISION_DEAD_LETTER, PROVISION_QUEUE
+from tou_cache import ACCEPT_DEAD_LETTER, ACCEPT_QUEUE
+import admission
+import metrics
+import profiling
+import querystats
+import tracing
 
 app = Flask(__name__)
 app.register_blueprint(tou_bp)
 app.register_blueprint(flog_bp)
 app.register_blueprint(email_bp)
+app.register_blueprint(analysis_bp)
+app.register_blueprint(license_bp)
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
-r = redis.from_url(REDIS_URL)
+r = metrics.TimedRedis.from_url(REDIS_URL)
 q = Queue("events", connection=r)
+metrics.init_app(app, r, rq_queues=[q], lists={ACCEPT_QUEUE: "accepted_at", ACCEPT_DEAD_LETTER: "failed_at",
+                                                PROVISION_QUEUE: "received_at", PROVISION_DEAD_LETTER: "failed_at"})
+admission.init_app(app)
+profiling.init_app(app)
+querystats.init_app(app)
+tracing.init_app(app)
 
 MAILGUN_SIGNING_KEY = os.environ.get("MAILGUN_SIGNING_KEY")
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*")
@@ -28,6 +43,7 @@ SESSION_TTL_MIN = int(os.environ.get("SESSION_TTL_MIN", "4320"))  # 3 days defau
 MAGIC_TTL_MIN = int(os.environ.get("MAGIC_TTL_MIN", "15"))
 OTP_TTL_MIN = int(os.environ.get("OTP_TTL_MIN", "10"))
 OTP_ATTEMPT_MAX = int(os.environ.get("OTP_ATTEMPT_MAX", "5"))
+TOU_ENFORCE = os.environ.get("TOU_ENFORCE", "false").lower() == "true"
 
 
 def cors(resp):
@@ -57,15 +73,15 @@ def auth_start():
         response = send_mailgun("otp_code", to=email, variables={"first_name": first_name, "code": code, "minutes": OTP_TTL_MIN, "host": host})
         
         # Log email with auth code for tracking
-        import psycopg
+        from db import connection
         from datetime import datetime, timezone
         try:
-            with psycopg.connect(os.environ.get("DB_URL")) as conn:
+            with connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute("""
                         INSERT INTO email_logs 
-                        (email, template, auth_code, mailgun_id, status, variables, sent_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        (email, template, auth_code, mailgun_id, status, variables, metadata, sent_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
                     """, (
                         email,
                         'otp_code',
@@ -73,6 +89,7 @@ def auth_start():
                         response.json().get('id') if response.ok else None,
                         'sent' if response.ok else 'failed',
                         {"first_name": first_name, "code": code, "minutes": OTP_TTL_MIN, "host": host},
+                        tracing.with_trace({}),
                         datetime.now(timezone.utc)
                     ))
                     conn.commit()
@@ -171,6 +188,13 @@ def authz():
             return ("forbidden", 403)
     except Exception:
         return ("unauthorized", 401)
+    # Optional: require acceptance of the active TOU (Redis lookup, no DB query when warm)
+    if TOU_ENFORCE:
+        try:
+            if not has_accepted_active(email):
+                return ("tou acceptance required", 403, {"X-TOU-Required": "true"})
+        except Exception:
+            pass
     return ("ok", 200)
 
 
@@ -181,7 +205,8 @@ def track():
     try:
         event = request.get_json(force=True)
         event["received_at"] = datetime.now(timezone.utc).isoformat()
-        q.enqueue("worker.handle_event", event)
+        with tracing.span("rq.enqueue worker.handle_event", "producer", **{"event.type": event.get("type")}):
+            q.enqueue("worker.handle_event", tracing.inject(event))
         return cors(jsonify({"ok": True}))
     except Exception as e:
         return cors((jsonify({"ok": False, "error": str(e)}), 400))
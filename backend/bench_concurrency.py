@@ -0,0 +1,155 @@
+"""
+Concurrent capacity of the events API under gunicorn, per worker class.
+
+For each --modes entry (sync, gthread) this starts gunicorn with
+gunicorn.conf.py on a local port, drives --path with 1..N concurrent
+keep-alive clients for --duration seconds per level and prints throughput,
+throughput per core (one worker process per core) and latency percentiles.
+
+--io-ms adds a /_bench/io route that sleeps that long, standing in for a
+Postgres connect, Redis round trip or Mailgun call, so the effect of
+blocking I/O shows without a database:
+
+    python bench_concurrency.py --path /_bench/io --io-ms 50 --concurrency 1,8,32,64
+    DB_URL=... REDIS_URL=... python bench_concurrency.py --path "/api/authz" \\
+        --header "Cookie: session=..." --header "X-Forwarded-Host: book.example.com"
+
+The load generator runs in this process; keep its concurrency well below
+what one Python process can drive, or run it on another machine.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HOST = "127.0.0.1"
+
+
+def bench_app():
+    """gunicorn entry point: the events API plus the simulated-I/O route"""
+    from app import app
+    io_ms = float(os.environ.get("BENCH_IO_MS", "0"))
+
+    def bench_io():
+        time.sleep(io_ms / 1000)
+        return {"ok": True}
+
+    app.add_url_rule("/_bench/io", "bench_io", bench_io)
+    return app
+
+
+def _wait_ready(port, proc, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request("GET", "/healthz")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start")
+
+
+def serve(mode, port, workers, threads, io_ms):
+    env = dict(
+        os.environ,
+        GUNICORN_BIND=f"{HOST}:{port}",
+        GUNICORN_WORKER_CLASS=mode,
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_THREADS=str(threads),
+        BENCH_IO_MS=str(io_ms),
+        # Measure capacity, not admission.py shedding excess load with 503s
+        ADMISSION_ENABLED="false",
+        PROMETHEUS_MULTIPROC_DIR=f"/tmp/bench-prometheus-{port}",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+         "bench_concurrency:bench_app()"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    _wait_ready(port, proc)
+    return proc
+
+
+def _client(port, path, headers, stop_at, latencies, errors):
+    conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 500:
+                errors.append(resp.status)
+            else:
+                latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors.append("conn")
+            conn.close()
+            conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    conn.close()
+
+
+def drive(port, path, headers, concurrency, duration):
+    latencies, errors = [], []
+    stop_at = time.monotonic() + duration
+    clients = [
+        threading.Thread(target=_client, args=(port, path, headers, stop_at, latencies, errors))
+        for _ in range(concurrency)
+    ]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    return latencies, errors
+
+
+def _ms(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent capacity per gunicorn worker class")
+    parser.add_argument("--modes", default="sync,gthread")
+    parser.add_argument("--path", default="/_bench/io")
+    parser.add_argument("--header", action="append", default=[], help='"Name: value", repeatable')
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--io-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    headers = dict(h.split(":", 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"{args.path}, {args.workers} workers, {args.threads} threads (gthread), io {args.io_ms:g} ms, "
+          f"{args.duration:g}s per level")
+    print(f"{'mode':8} {'clients':>7} {'req/s':>9} {'req/s/core':>11} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in args.modes.split(","):
+        proc = serve(mode, args.port, args.workers, args.threads, args.io_ms)
+        try:
+            for concurrency in levels:
+                latencies, errors = drive(args.port, args.path, headers, concurrency, args.duration)
+                rps = len(latencies) / args.duration
+                print(f"{mode:8} {concurrency:>7} {rps:>9.1f} {rps / args.workers:>11.1f} "
+                      f"{_ms(latencies, 50):>8.1f} {_ms(latencies, 99):>8.1f} {len(errors):>7}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark for /api/flog/search against a seeded corpus.
+
+Seeds N synthetic published articles (slugs prefixed with "bench-"), runs a
+set of queries through the Flask test client and reports latency
+percentiles, then removes the seeded rows.
+
+Usage:
+    DB_URL=postgresql://... python bench_flog_search.py --articles 5000 --runs 50
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app import app
+from flog_api import _conn
+
+VOCABULARY = (
+    "hero chaos order myth symbol osiris horus heraldry fraud meaning maps "
+    "belief archetype jung campbell dragon serpent yin yang lecture ideology "
+    "manifesto rhetoric entitlement supremacy narrative scholarship citation "
+    "harvard psychology lobster hierarchy tradition sacrifice redemption"
+).split()
+
+QUERIES = (
+    "heraldry",
+    "hero myth",
+    '"chaos and order"',
+    "osiris -horus",
+    "fraud scholarship citation",
+)
+
+SLUG_PREFIX = "bench-"
+
+
+def _paragraph(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def seed(count, seed_value=2083):
+    rng = random.Random(seed_value)
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(
+                "COPY flog_articles (slug, title, excerpt, content, author, tags, is_published, published_at) FROM STDIN"
+            ) as copy:
+                for i in range(count):
+                    content = "\n\n".join(_paragraph(rng, rng.randint(60, 160)) for _ in range(rng.randint(4, 12)))
+                    copy.write_row((
+                        f"{SLUG_PREFIX}{i}",
+                        _paragraph(rng, 8),
+                        _paragraph(rng, 30),
+                        content,
+                        "Bench",
+                        rng.sample(["peterson", "heraldry", "fraud", "myth", "rhetoric"], 2),
+                        True,
+                        "2024-01-01",
+                    ))
+        conn.commit()
+
+
+def cleanup():
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM flog_articles WHERE slug LIKE %s", (SLUG_PREFIX + "%",))
+        conn.commit()
+
+
+def run(runs):
+    client = app.test_client()
+    for q in QUERIES:
+        for params in ({"q": q}, {"q": q, "tag": "heraldry"}):
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                resp = client.get("/api/flog/search", query_string=params)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert resp.status_code == 200, resp.get_data(as_text=True)
+            timings.sort()
+            label = " ".join(f"{k}={v}" for k, v in params.items())
+            print(f"{label:<45} p50={statistics.median(timings):7.2f}ms "
+                  f"p95={timings[int(len(timings) * 0.95) - 1]:7.2f}ms "
+                  f"hits={len(resp.get_json()['results'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in place")
+    args = parser.parse_args()
+
+    cleanup()
+    start = time.perf_counter()
+    seed(args.articles)
+    with _conn() as conn:
+        conn.execute("ANALYZE flog_articles")
+    print(f"seeded {args.articles} articles in {time.perf_counter() - start:.1f}s")
+    try:
+        run(args.runs)
+    finally:
+        if not args.keep:
+            cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
 import os
+import json
+import threading
 from typing import List, Dict
 import psycopg
+from psycopg_pool import ConnectionPool
 from datetime import datetime, timezone
 
+from metrics import TimedCursor, TimedRedis, cache_result
+
 DB_URL = os.environ.get("DB_URL")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+LICENSE_CACHE_KEY = "licenses:{email}"
+LICENSE_CACHE_TTL = int(os.environ.get("LICENSE_CACHE_TTL", "300"))
+LICENSE_INVALIDATE_BATCH = int(os.environ.get("LICENSE_INVALIDATE_BATCH", "1000"))
+# Per-process pool; one connection per gunicorn thread is enough. 0 disables it.
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", os.environ.get("GUNICORN_THREADS", "8")))
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+
+r = TimedRedis.from_url(REDIS_URL)
 
 # Entitlement mapping per tier (fallback to env overrides)
 DEFAULT_TIER_ENTITLEMENTS = {
@@ -19,10 +34,46 @@ LAB_DOMAIN = os.environ.get("LAB_DOMAIN", "").lower()
 APP_DOMAIN = os.environ.get("APP_DOMAIN", "").lower()
 
 
-def _conn():
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ConnectionPool:
+    global _pool, _pool_pid
+    # A pool inherited through fork shares its sockets with the parent: start over
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    DB_URL,
+                    min_size=min(DB_POOL_MIN, DB_POOL_MAX),
+                    max_size=DB_POOL_MAX,
+                    timeout=DB_POOL_TIMEOUT,
+                    kwargs={"cursor_factory": TimedCursor},
+                    name=f"db-{os.getpid()}",
+                    open=True,
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def connection():
+    """
+    `with connection() as conn:` commits on success and rolls back on error,
+    like `with psycopg.connect(...)`, but borrows the connection from the
+    process's pool instead of opening one per request. Raises
+    psycopg_pool.PoolTimeout if none frees up within DB_POOL_TIMEOUT seconds.
+    """
     if not DB_URL:
         raise RuntimeError("DB_URL not configured")
-    return psycopg.connect(DB_URL)
+    if DB_POOL_MAX <= 0:
+        return psycopg.connect(DB_URL, cursor_factory=TimedCursor)
+    return _get_pool().connection()
+
+
+def _conn():
+    return connection()
 
 
 def _tier_entitlements() -> Dict[str, List[str]]:
@@ -40,8 +91,8 @@ def _tier_entitlements() -> Dict[str, List[str]]:
     return ent
 
 
-def user_active_licenses(email: str) -> List[Dict]:
-    """Return list of active licenses for user email.
+def _load_active_licenses(emails: List[str]) -> Dict[str, List[Dict]]:
+    """Active licenses for many emails in one query, keyed by lowercased email.
     Schema expected from your docs:
       - licenses(id, license_tier, expiration_date, is_active, ...)
       - license_users(license_id, email, ...)
@@ -49,27 +100,112 @@ def user_active_licenses(email: str) -> List[Dict]:
     """
     sql = (
         """
-        SELECT l.id, l.license_tier, l.expiration_date, l.is_active
+        SELECT LOWER(u.email), l.id, l.license_tier, l.expiration_date, l.is_active
         FROM licenses l
         JOIN license_users u ON u.license_id = l.id
-        WHERE LOWER(u.email) = LOWER(%s)
+        WHERE LOWER(u.email) = ANY(%s)
           AND COALESCE(l.is_active, true) = true
           AND (l.expiration_date IS NULL OR l.expiration_date > NOW())
         """
     )
+    found = {e.lower(): [] for e in emails}
     with _conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, (email,))
-            rows = cur.fetchall()
-            return [
-                {
-                    "id": r[0],
-                    "tier": (r[1] or "").lower(),
-                    "expires": r[2],
-                    "active": r[3],
-                }
-                for r in rows
-            ]
+            cur.execute(sql, ([e.lower() for e in emails],))
+            for r in cur.fetchall():
+                found.setdefault(r[0], []).append(
+                    {
+                        "id": r[1],
+                        "tier": (r[2] or "").lower(),
+                        "expires": r[3],
+                        "active": r[4],
+                    }
+                )
+    return found
+
+
+# --- License cache ---
+# licenses:<email> holds the JSON list of a user's active licenses (possibly
+# empty). Entitlement and registration checks read it instead of Postgres;
+# license_provisioner.py overwrites it right after provisioning, so a fresh
+# purchase is never hidden behind a cached empty list. Every other change to
+# licenses or license_users, including manual SQL, queues the affected emails
+# in license_cache_invalidations (migration 013); the provisioner drains it
+# with drain_license_invalidations().
+
+def _cache_licenses(by_email: Dict[str, List[Dict]]):
+    try:
+        pipe = r.pipeline(transaction=False)
+        for email, lics in by_email.items():
+            payload = [dict(lic, expires=lic["expires"].isoformat() if lic["expires"] else None) for lic in lics]
+            pipe.setex(LICENSE_CACHE_KEY.format(email=email), LICENSE_CACHE_TTL, json.dumps(payload))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _decode_licenses(raw) -> List[Dict]:
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    out = []
+    for lic in json.loads(raw):
+        expires = datetime.fromisoformat(lic["expires"]) if lic["expires"] else None
+        if expires is None or expires > now:
+            out.append(dict(lic, expires=expires))
+    return out
+
+
+def user_active_licenses(email: str) -> List[Dict]:
+    """Return list of active licenses for user email (cached in Redis)."""
+    email = email.lower()
+    try:
+        raw = r.get(LICENSE_CACHE_KEY.format(email=email))
+    except Exception:
+        raw = None
+    if raw is not None:
+        cache_result("licenses", "hit")
+        return _decode_licenses(raw)
+    cache_result("licenses", "miss")
+    licenses = _load_active_licenses([email])[email]
+    _cache_licenses({email: licenses})
+    return licenses
+
+
+def warm_license_cache(emails: List[str]):
+    """Reload the cached licenses of these users from Postgres"""
+    for i in range(0, len(emails), 1000):
+        _cache_licenses(_load_active_licenses(emails[i:i + 1000]))
+
+
+def invalidate_license_cache(emails: List[str]):
+    try:
+        r.delete(*[LICENSE_CACHE_KEY.format(email=e.lower()) for e in emails])
+    except Exception:
+        pass
+
+
+def drain_license_invalidations(conn) -> int:
+    """
+    Delete the cache entries queued by the migration 013 triggers; returns
+    how many queue rows were consumed. Rows are only removed once the Redis
+    delete succeeded, so a failure leaves them for the next call.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM license_cache_invalidations
+            WHERE id IN (
+                SELECT id FROM license_cache_invalidations
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING email
+        """, (LICENSE_INVALIDATE_BATCH,))
+        rows = cur.fetchall()
+        emails = sorted({email.lower() for (email,) in rows})
+        if emails:
+            r.delete(*[LICENSE_CACHE_KEY.format(email=e) for e in emails])
+    conn.commit()
+    return len(rows)
 
 
 def _scope_for_host(host: str) -> str | None:
@@ -102,4 +238,41 @@ def has_user_entitlement(email: str, host: str) -> bool:
         tier = (lic.get("tier") or "").lower()
         if scope in ent.get(tier, []):
             return True
-    return False
\ No newline at end of file
+    return False
+
+def bulk_user_licenses(emails: List[str]) -> Dict[str, List[Dict]]:
+    """Active licenses for many users: one Redis MGET, one query for the misses"""
+    emails = list(dict.fromkeys(e.lower() for e in emails))
+    found = {}
+    try:
+        cached = r.mget([LICENSE_CACHE_KEY.format(email=e) for e in emails])
+    except Exception:
+        cached = [None] * len(emails)
+    misses = []
+    for email, raw in zip(emails, cached):
+        if raw is None:
+            misses.append(email)
+        else:
+            found[email] = _decode_licenses(raw)
+    cache_result("licenses", "hit", len(emails) - len(misses))
+    cache_result("licenses", "miss", len(misses))
+    if misses:
+        loaded = _load_active_licenses(misses)
+        _cache_licenses(loaded)
+        found.update(loaded)
+    return found
+
+
+def bulk_entitlements(pairs: List[tuple]) -> List[bool]:
+    """has_user_entitlement() for many (email, host) pairs, in input order"""
+    ent = _tier_entitlements()
+    scopes = [_scope_for_host(host) for _, host in pairs]
+    licenses = bulk_user_licenses([email for (email, _), scope in zip(pairs, scopes) if scope])
+    results = []
+    for (email, _), scope in zip(pairs, scopes):
+        if not scope:
+            results.append(True)  # if host not recognized, do not block
+            continue
+        tiers = {lic["tier"] for lic in licenses.get(email.lower(), [])}
+        results.append(any(scope in ent.get(tier, []) for tier in tiers))
+    return results
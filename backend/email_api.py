@@ -4,18 +4,15 @@ Email API for managing and triggering emails with user tracking.
 import os
 from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
-import psycopg
 from email_mailgun import send_mailgun
+from db import connection
+from tracing import with_trace
 
 email_bp = Blueprint('email', __name__, url_prefix='/api/email')
 
-DB_URL = os.environ.get("DB_URL")
-
 
 def _conn():
-    if not DB_URL:
-        raise RuntimeError("DB_URL not configured")
-    return psycopg.connect(DB_URL)
+    return connection()
 
 
 @email_bp.route('/send', methods=['POST'])
@@ -87,7 +84,7 @@ def send_email():
                         mailgun_id,
                         status,
                         variables,
-                        metadata,
+                        with_trace(metadata),
                         datetime.now(timezone.utc)
                     ))
                     email_log_id = cur.fetchone()[0]
@@ -324,7 +321,7 @@ def trigger_welcome_email():
                     response.json().get('id') if response.ok else None,
                     'sent' if response.ok else 'failed',
                     variables,
-                    {"license_id": license_id, "tier": tier},
+                    with_trace({"license_id": license_id, "tier": tier}),
                     datetime.now(timezone.utc)
                 ))
                 conn.commit()
@@ -381,7 +378,7 @@ def trigger_abandoned_cart_email():
                     response.json().get('id') if response.ok else None,
                     'sent' if response.ok else 'failed',
                     variables,
-                    {"tier": tier, "cart_id": cart_id},
+                    with_trace({"tier": tier, "cart_id": cart_id}),
                     datetime.now(timezone.utc)
                 ))
                 conn.commit()
@@ -1,7 +1,11 @@
 import os
+import time
 import requests
 from jinja2 import Template
 
+from metrics import MAILGUN_LATENCY, MAILGUN_REQUESTS
+import tracing
+
 MAILGUN_DOMAIN = os.environ.get("MAILGUN_DOMAIN")
 MAILGUN_API_KEY = os.environ.get("MAILGUN_API_KEY")
 MAILGUN_FROM = os.environ.get("MAILGUN_FROM", f"Parallel Critiques <no-reply@{MAILGUN_DOMAIN}>")
@@ -57,15 +61,33 @@ def send_mailgun(template: str, to: str, variables: dict) -> requests.Response:
     tmpl = TEMPLATES[template]
     subject = tmpl["subject"]
     html = tmpl["html"].render(**variables)
-    return requests.post(
-        f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
-        auth=("api", MAILGUN_API_KEY),
-        data={
-            "from": MAILGUN_FROM,
-            "to": [to],
-            "subject": subject,
-            "html": html,
-            "o:tag": [template],
-        },
-        timeout=10,
-    )
+    data = {
+        "from": MAILGUN_FROM,
+        "to": [to],
+        "subject": subject,
+        "html": html,
+        "o:tag": [template],
+    }
+    start = time.perf_counter()
+    with tracing.span("mailgun.send", "client", template=template) as span:
+        if span.traceparent:
+            # Echoed back as user-variables in Mailgun's webhooks (worker.handle_mailgun_event)
+            data["v:traceparent"] = span.traceparent
+            data["v:sent_at"] = f"{time.time():.3f}"
+        try:
+            resp = requests.post(
+                f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
+                auth=("api", MAILGUN_API_KEY),
+                data=data,
+                timeout=10,
+            )
+        except Exception:
+            MAILGUN_REQUESTS.labels(template, "network_error").inc()
+            raise
+        finally:
+            MAILGUN_LATENCY.labels(template).observe(time.perf_counter() - start)
+        span.set(**{"http.status_code": resp.status_code})
+        if not resp.ok:
+            span.fail(f"HTTP {resp.status_code}")
+    MAILGUN_REQUESTS.labels(template, "ok" if resp.ok else "http_error").inc()
+    return resp
@@ -2,19 +2,87 @@
 Flog (Fraud Blog) API endpoints for managing articles.
 """
 import os
+import base64
 from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
 import psycopg
+from rq import Queue
+from admin import require_admin
+from flog_render import render_article, content_hash, valid_slug
+from flog_import import import_directory, IMPORT_ROOT
+from db import connection
+from metrics import TimedRedis
 
-DB_URL = os.environ.get("DB_URL")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 
 flog_bp = Blueprint('flog', __name__, url_prefix='/api/flog')
 
 
 def _conn():
-    if not DB_URL:
-        raise RuntimeError("DB_URL not configured")
-    return psycopg.connect(DB_URL)
+    return connection()
+
+
+_queue = None
+
+
+def _events_queue():
+    global _queue
+    if _queue is None:
+        _queue = Queue("events", connection=TimedRedis.from_url(REDIS_URL))
+    return _queue
+
+
+def _queue_article_jobs(*slugs):
+    """Ask the worker to refresh derived data (static snapshot, related index) for these slugs"""
+    slugs = [s for s in slugs if s]
+    try:
+        queue = _events_queue()
+        queue.enqueue("flog_static.regenerate", slugs)
+        queue.enqueue("flog_related.refresh", slugs)
+    except Exception:
+        pass
+
+
+# Upper bound for ?limit= so a single list request can't pull the whole archive
+MAX_LIMIT = int(os.environ.get("FLOG_MAX_LIMIT", "100"))
+
+# Columns exposed by the list endpoint. "summary" drops the markdown body;
+# the rendered HTML and table of contents are only returned via ?fields=.
+SUMMARY_FIELDS = ("id", "slug", "title", "excerpt", "author", "tags",
+                  "word_count", "reading_time_min",
+                  "published_at", "created_at", "updated_at")
+FULL_FIELDS = SUMMARY_FIELDS + ("content",)
+EXTRA_FIELDS = ("content_html", "toc")
+
+
+def _requested_fields(published_only):
+    """Resolve ?view= / ?fields= into an ordered tuple of whitelisted columns"""
+    allowed = FULL_FIELDS if published_only else FULL_FIELDS + ("is_published",)
+    requested = request.args.get('fields')
+    if requested:
+        wanted = [f.strip() for f in requested.split(",") if f.strip()]
+        fields = tuple(f for f in allowed + EXTRA_FIELDS if f in wanted)
+        return fields or ("id", "slug")
+    if request.args.get('view', 'full').lower() == 'summary':
+        return tuple(f for f in allowed if f != "content")
+    return allowed
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _encode_cursor(ts, article_id):
+    raw = f"{ts.isoformat()}|{article_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    ts, article_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+    return datetime.fromisoformat(ts), int(article_id)
 
 
 def cors(resp):
@@ -47,56 +115,156 @@ def get_articles():
     Returns all published Flog articles ordered by publish date (newest first).
     
     Optional query params:
-    - limit: max number of articles to return (default: 50)
+    - limit: max number of articles to return (default: 50, capped at FLOG_MAX_LIMIT)
     - published: true/false to filter by published status (default: true)
+    - view: "summary" omits the article content (list views)
+    - fields: comma-separated list of fields to return (e.g. "slug,title,excerpt")
+    - cursor: opaque keyset cursor taken from a previous response's "next_cursor"
+    - tag: only return articles carrying this tag (repeatable, all must match)
     """
     try:
-        limit = int(request.args.get('limit', 50))
+        limit = max(1, min(int(request.args.get('limit', 50)), MAX_LIMIT))
         published_only = request.args.get('published', 'true').lower() == 'true'
+        fields = _requested_fields(published_only)
+        cursor = request.args.get('cursor')
+        tags = [t.strip() for t in request.args.getlist('tag') if t.strip()]
+        
+        # Keyset pagination over (sort_col, id). For published articles the
+        # sort column matches idx_flog_published, so each page is an index
+        # range scan instead of an OFFSET walk over the whole archive.
+        sort_col = "published_at" if published_only else "created_at"
+        where = ["is_published = true", "published_at <= NOW()"] if published_only else []
+        params = []
+        if tags:
+            # Served by the GIN index on tags
+            where.append("tags @> %s")
+            params.append(tags)
+        if cursor:
+            try:
+                after_ts, after_id = _decode_cursor(cursor)
+            except Exception:
+                return cors((jsonify({
+                    "ok": False,
+                    "error": "invalid cursor"
+                }), 400))
+            where.append(f"({sort_col}, id) < (%s, %s)")
+            params.extend([after_ts, after_id])
+        
+        columns = list(fields)
+        for col in ("id", sort_col):
+            if col not in columns:
+                columns.append(col)
+        
+        sql = f"SELECT {', '.join(columns)} FROM flog_articles"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort_col} DESC, id DESC LIMIT %s"
+        # Fetch one extra row to know whether another page exists
+        params.append(limit + 1)
         
         with _conn() as conn:
             with conn.cursor() as cur:
-                if published_only:
-                    cur.execute("""
-                        SELECT id, slug, title, excerpt, content, author, tags, 
-                               published_at, created_at, updated_at
-                        FROM flog_articles
-                        WHERE is_published = true AND published_at <= NOW()
-                        ORDER BY published_at DESC
-                        LIMIT %s
-                    """, (limit,))
-                else:
-                    cur.execute("""
-                        SELECT id, slug, title, excerpt, content, author, tags, 
-                               is_published, published_at, created_at, updated_at
-                        FROM flog_articles
-                        ORDER BY created_at DESC
-                        LIMIT %s
-                    """, (limit,))
-                
+                cur.execute(sql, params)
                 rows = cur.fetchall()
                 
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    last = dict(zip(columns, rows[-1]))
+                    if last[sort_col] is not None:
+                        next_cursor = _encode_cursor(last[sort_col], last["id"])
+                
                 articles = []
                 for row in rows:
-                    article = {
-                        "id": row[0],
-                        "slug": row[1],
-                        "title": row[2],
-                        "excerpt": row[3],
-                        "content": row[4],
-                        "author": row[5],
-                        "tags": row[6],
-                        "published_at": row[7].isoformat() if row[7] else None,
-                        "created_at": row[8].isoformat() if row[8] else None,
-                        "updated_at": row[9].isoformat() if row[9] else None
-                    }
-                    if not published_only and len(row) > 10:
-                        article["is_published"] = row[7]
-                    articles.append(article)
+                    values = dict(zip(columns, row))
+                    articles.append({
+                        field: _serialize(values[field])
+                        for field in fields
+                    })
+                
+                return cors(jsonify({
+                    "ok": True,
+                    "articles": articles,
+                    "next_cursor": next_cursor
+                }))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
+
+
+@flog_bp.route('/search', methods=['GET'])
+def search_articles():
+    """
+    GET /api/flog/search?q=<query>
+    Full-text search over published articles, ranked by relevance.
+    
+    Query params:
+    - q: search query (web-search syntax: "quoted phrases", -exclusions, or)
+    - tag: only return articles carrying this tag (repeatable)
+    - limit: max number of results (default: 20, capped at FLOG_MAX_LIMIT)
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return cors((jsonify({
+            "ok": False,
+            "error": "q is required"
+        }), 400))
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_LIMIT))
+        tags = [t.strip() for t in request.args.getlist('tag') if t.strip()]
+        
+        where = [
+            "is_published = true",
+            "published_at <= NOW()",
+            "search_vector @@ query",
+        ]
+        params = [q]
+        if tags:
+            where.append("tags @> %s")
+            params.append(tags)
+        params.append(limit)
+        
+        # Rank and limit first, then build headlines only for the rows that
+        # are returned: ts_headline re-parses the document and is the most
+        # expensive part of the query.
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT id, slug, title, excerpt, author, tags, published_at, rank,
+                           ts_headline('english', content, query,
+                                       'MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<mark>, StopSel=</mark>')
+                    FROM (
+                        SELECT id, slug, title, excerpt, content, author, tags, published_at,
+                               query, ts_rank(search_vector, query) AS rank
+                        FROM flog_articles, websearch_to_tsquery('english', %s) AS query
+                        WHERE {' AND '.join(where)}
+                        ORDER BY rank DESC, published_at DESC
+                        LIMIT %s
+                    ) AS hits
+                    ORDER BY rank DESC, published_at DESC
+                """, params)
+                rows = cur.fetchall()
                 
                 return cors(jsonify({
                     "ok": True,
-                    "articles": articles
+                    "query": q,
+                    "results": [
+                        {
+                            "id": row[0],
+                            "slug": row[1],
+                            "title": row[2],
+                            "excerpt": row[3],
+                            "author": row[4],
+                            "tags": row[5],
+                            "published_at": row[6].isoformat() if row[6] else None,
+                            "rank": float(row[7]),
+                            "snippet": row[8]
+                        }
+                        for row in rows
+                    ]
                 }))
     except Exception as e:
         return cors((jsonify({
@@ -105,6 +273,128 @@ def get_articles():
         }), 500))
 
 
+@flog_bp.route('/tags', methods=['GET'])
+def get_tags():
+    """
+    GET /api/flog/tags
+    Returns every tag with its number of published articles (most used first).
+    Counts come from flog_tag_counts, which a trigger keeps up to date.
+    """
+    try:
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT tag, article_count
+                    FROM flog_tag_counts
+                    WHERE article_count > 0
+                    ORDER BY article_count DESC, tag
+                """)
+                rows = cur.fetchall()
+                
+                return cors(jsonify({
+                    "ok": True,
+                    "tags": [
+                        {"tag": row[0], "count": row[1]}
+                        for row in rows
+                    ]
+                }))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
+
+
+@flog_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    GET /api/flog/changes?since=<cursor>
+    Returns articles written after the cursor plus tombstones for deleted,
+    renamed or unpublished articles. Start with since=0 for a full sync, then
+    pass back "next_cursor" until "has_more" is false. Clients should apply
+    tombstones first, then upsert articles.
+    
+    Articles scheduled for a future published_at are sent as tombstones. When
+    they go live, flog_static.publish_due() stamps them with a new change_seq
+    so they are sent again.
+    
+    Optional query params:
+    - limit: max number of changes per page (default: 100, capped at FLOG_MAX_LIMIT)
+    - view / fields: same projection as /articles
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_LIMIT))
+        fields = _requested_fields(True)
+        columns = list(fields)
+        for col in ("id", "slug", "change_seq", "visible"):
+            if col not in columns:
+                columns.append(col)
+        select = [
+            "is_published = true AND published_at <= NOW() AS visible" if col == "visible" else col
+            for col in columns
+        ]
+        
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT {', '.join(select)}
+                    FROM flog_articles
+                    WHERE change_seq > %s
+                    ORDER BY change_seq
+                    LIMIT %s
+                """, (since, limit + 1))
+                changes = [("article", dict(zip(columns, row))) for row in cur.fetchall()]
+                
+                cur.execute("""
+                    SELECT change_seq, article_id, slug
+                    FROM flog_tombstones
+                    WHERE change_seq > %s
+                    ORDER BY change_seq
+                    LIMIT %s
+                """, (since, limit + 1))
+                changes += [
+                    ("tombstone", {"change_seq": row[0], "id": row[1], "slug": row[2]})
+                    for row in cur.fetchall()
+                ]
+        
+        changes.sort(key=lambda c: c[1]["change_seq"])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        
+        articles = []
+        tombstones = []
+        for kind, values in changes:
+            if kind == "article" and values["visible"]:
+                article = {field: _serialize(values[field]) for field in fields}
+                article["change_seq"] = values["change_seq"]
+                articles.append(article)
+            else:
+                tombstones.append({
+                    "id": values["id"],
+                    "slug": values["slug"],
+                    "change_seq": values["change_seq"],
+                })
+        
+        return cors(jsonify({
+            "ok": True,
+            "articles": articles,
+            "tombstones": tombstones,
+            "next_cursor": str(changes[-1][1]["change_seq"]) if changes else str(since),
+            "has_more": has_more
+        }))
+    except ValueError:
+        return cors((jsonify({
+            "ok": False,
+            "error": "since must be an integer cursor"
+        }), 400))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
+
+
 @flog_bp.route('/articles/<slug>', methods=['GET'])
 def get_article(slug):
     """
@@ -116,7 +406,8 @@ def get_article(slug):
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT id, slug, title, excerpt, content, author, tags, 
-                           published_at, created_at, updated_at
+                           published_at, created_at, updated_at,
+                           content_html, toc, word_count, reading_time_min
                     FROM flog_articles
                     WHERE slug = %s AND is_published = true
                 """, (slug,))
@@ -139,7 +430,11 @@ def get_article(slug):
                     "tags": row[6],
                     "published_at": row[7].isoformat() if row[7] else None,
                     "created_at": row[8].isoformat() if row[8] else None,
-                    "updated_at": row[9].isoformat() if row[9] else None
+                    "updated_at": row[9].isoformat() if row[9] else None,
+                    "content_html": row[10],
+                    "toc": row[11],
+                    "word_count": row[12],
+                    "reading_time_min": row[13]
                 }
                 
                 return cors(jsonify({
@@ -153,6 +448,53 @@ def get_article(slug):
         }), 500))
 
 
+@flog_bp.route('/articles/<slug>/related', methods=['GET'])
+def get_related_articles(slug):
+    """
+    GET /api/flog/articles/<slug>/related
+    Returns the most similar published articles (TF-IDF cosine), read from
+    the precomputed flog_related table.
+    
+    Optional query params:
+    - limit: max number of related articles (default: 5)
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 5)), MAX_LIMIT))
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT a.slug, a.title, a.excerpt, a.tags, a.published_at, r.score
+                    FROM flog_articles src
+                    JOIN flog_related r ON r.article_id = src.id
+                    JOIN flog_articles a ON a.id = r.related_id
+                    WHERE src.slug = %s
+                      AND a.is_published = true AND a.published_at <= NOW()
+                    ORDER BY r.rank
+                    LIMIT %s
+                """, (slug, limit))
+                rows = cur.fetchall()
+                
+                return cors(jsonify({
+                    "ok": True,
+                    "related": [
+                        {
+                            "slug": row[0],
+                            "title": row[1],
+                            "excerpt": row[2],
+                            "tags": row[3],
+                            "published_at": row[4].isoformat() if row[4] else None,
+                            "score": row[5]
+                        }
+                        for row in rows
+                    ]
+                }))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
+
+
 @flog_bp.route('/articles', methods=['POST'])
 def create_article():
     """
@@ -193,23 +535,38 @@ def create_article():
         if not slug:
             slug = title.lower().replace(" ", "-").replace("'", "")
             # Remove special characters
-            slug = "".join(c for c in slug if c.isalnum() or c == "-")
+            slug = "".join(c for c in slug if (c.isascii() and c.isalnum()) or c == "-")
+        
+        if not valid_slug(slug):
+            return cors((jsonify({
+                "ok": False,
+                "error": "slug must match ^[a-z0-9-]+$"
+            }), 400))
         
         # Set published_at to now if publishing and no date provided
         if is_published and not published_at:
             published_at = datetime.now(timezone.utc)
         
+        # Render once at write time; readers get the stored HTML
+        rendered = render_article(content)
+        
         with _conn() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO flog_articles 
-                    (slug, title, excerpt, content, author, tags, is_published, published_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    (slug, title, excerpt, content, author, tags, is_published, published_at,
+                     content_html, content_hash, word_count, reading_time_min, toc)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                     RETURNING id, slug, created_at
-                """, (slug, title, excerpt, content, author, tags, is_published, published_at))
+                """, (
+                    slug, title, excerpt, content, author, tags, is_published, published_at,
+                    rendered["content_html"], rendered["content_hash"], rendered["word_count"],
+                    rendered["reading_time_min"], psycopg.types.json.Jsonb(rendered["toc"])
+                ))
                 
                 result = cur.fetchone()
                 conn.commit()
+                _queue_article_jobs(result[1])
                 
                 return cors(jsonify({
                     "ok": True,
@@ -241,8 +598,9 @@ def update_article(article_id):
         with _conn() as conn:
             with conn.cursor() as cur:
                 # Check if article exists
-                cur.execute("SELECT id FROM flog_articles WHERE id = %s", (article_id,))
-                if not cur.fetchone():
+                cur.execute("SELECT id, content_hash, slug FROM flog_articles WHERE id = %s", (article_id,))
+                existing = cur.fetchone()
+                if not existing:
                     return cors((jsonify({
                         "ok": False,
                         "error": "Article not found"
@@ -256,6 +614,11 @@ def update_article(article_id):
                     params.append(data["title"])
                 
                 if "slug" in data:
+                    if not valid_slug(data["slug"]):
+                        return cors((jsonify({
+                            "ok": False,
+                            "error": "slug must match ^[a-z0-9-]+$"
+                        }), 400))
                     updates.append("slug = %s")
                     params.append(data["slug"])
                 
@@ -266,6 +629,15 @@ def update_article(article_id):
                 if "content" in data:
                     updates.append("content = %s")
                     params.append(data["content"])
+                    
+                    # Re-render only when the markdown actually changed
+                    if content_hash(data["content"]) != existing[1]:
+                        rendered = render_article(data["content"])
+                        for column in ("content_html", "content_hash", "word_count", "reading_time_min"):
+                            updates.append(f"{column} = %s")
+                            params.append(rendered[column])
+                        updates.append("toc = %s")
+                        params.append(psycopg.types.json.Jsonb(rendered["toc"]))
                 
                 if "author" in data:
                     updates.append("author = %s")
@@ -302,6 +674,7 @@ def update_article(article_id):
                 cur.execute(sql, params)
                 result = cur.fetchone()
                 conn.commit()
+                _queue_article_jobs(existing[2], result[0])
                 
                 return cors(jsonify({
                     "ok": True,
@@ -328,7 +701,7 @@ def delete_article(article_id):
     try:
         with _conn() as conn:
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM flog_articles WHERE id = %s RETURNING id", (article_id,))
+                cur.execute("DELETE FROM flog_articles WHERE id = %s RETURNING id, slug", (article_id,))
                 result = cur.fetchone()
                 
                 if not result:
@@ -338,6 +711,7 @@ def delete_article(article_id):
                     }), 404))
                 
                 conn.commit()
+                _queue_article_jobs(result[1])
                 
                 return cors(jsonify({
                     "ok": True,
@@ -349,3 +723,50 @@ def delete_article(article_id):
             "ok": False,
             "error": str(e)
         }), 500))
+
+
+@flog_bp.route('/import', methods=['POST'])
+def import_articles():
+    """
+    POST /api/flog/import
+    Admin only (X-Admin-Key). Syncs a directory of markdown files with front
+    matter into flog_articles; unchanged files are skipped.
+    
+    Request body (all optional):
+    {
+        "directory": "peterson",  // relative to FLOG_IMPORT_ROOT
+        "dry_run": false
+    }
+    """
+    err = require_admin()
+    if err:
+        return cors(err)
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        directory = (IMPORT_ROOT / data.get("directory", "")).resolve()
+        if directory != IMPORT_ROOT and IMPORT_ROOT not in directory.parents:
+            return cors((jsonify({
+                "ok": False,
+                "error": "directory must be inside FLOG_IMPORT_ROOT"
+            }), 400))
+        if not directory.is_dir():
+            return cors((jsonify({
+                "ok": False,
+                "error": "directory not found"
+            }), 404))
+        
+        dry_run = bool(data.get("dry_run", False))
+        summary = import_directory(directory, dry_run=dry_run)
+        if summary["slugs"] and not dry_run:
+            _queue_article_jobs(*summary["slugs"])
+        
+        return cors(jsonify({
+            "ok": True,
+            "import": summary
+        }))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
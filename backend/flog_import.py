@@ -0,0 +1,207 @@
+"""
+Bulk import of Flog articles from markdown files.
+
+Each *.md file may start with YAML front matter:
+
+    ---
+    title: Maps of Meaning: The Architecture of Fraud
+    slug: maps-of-meaning-fraud
+    tags: [peterson, fraud]
+    author: Parallel Critiques
+    excerpt: How Peterson invented mythology and called it scholarship
+    is_published: true
+    published_at: 2024-03-01
+    ---
+
+Missing fields fall back to: slug = file name, title = first "# " heading.
+A published article without published_at gets the time of its first import;
+re-imports keep whatever date it already has.
+Unchanged files (same source_hash) are skipped. Changed files are rendered,
+COPY'd into a temp staging table and merged with one
+INSERT ... ON CONFLICT (slug) in a single transaction.
+
+    DB_URL=postgresql://... python flog_import.py [directory] [--dry-run]
+"""
+import hashlib
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import psycopg
+import yaml
+
+from flog_render import render_article, valid_slug
+from metrics import TimedCursor
+
+DB_URL = os.environ.get("DB_URL")
+IMPORT_ROOT = Path(os.environ.get("FLOG_IMPORT_ROOT", Path(__file__).parent / "flog_articles")).resolve()
+
+_FRONT_MATTER_RE = re.compile(r"\A---\s*\n(.*?)\n---\s*(?:\n|\Z)", re.S)
+_H1_RE = re.compile(r"\A\s*#\s+(.+?)\s*(?:\n|\Z)")
+
+STAGING_COLUMNS = ("slug", "title", "excerpt", "content", "author", "tags", "is_published",
+                   "published_at", "content_html", "content_hash", "word_count",
+                   "reading_time_min", "toc", "source_hash")
+
+
+def _conn():
+    if not DB_URL:
+        raise RuntimeError("DB_URL not configured")
+    return psycopg.connect(DB_URL, cursor_factory=TimedCursor)
+
+
+def _timestamp(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_article(path: Path, raw: str) -> dict:
+    """Split front matter from the body and fill in defaults"""
+    meta = {}
+    body = raw
+    match = _FRONT_MATTER_RE.match(raw)
+    if match:
+        meta = yaml.safe_load(match.group(1)) or {}
+        if not isinstance(meta, dict):
+            raise ValueError("front matter must be a mapping")
+        body = raw[match.end():]
+
+    title = meta.get("title")
+    if not title:
+        heading = _H1_RE.match(body)
+        if not heading:
+            raise ValueError("no title in front matter and no leading '# ' heading")
+        title = heading.group(1)
+        # The heading is the title; don't render it twice
+        body = body[heading.end():]
+
+    tags = meta.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",") if t.strip()]
+
+    is_published = bool(meta.get("is_published", meta.get("published", False)))
+    # None means "not given": the merge keeps the stored date, or uses NOW() on insert
+    published_at = _timestamp(meta.get("published_at"))
+
+    slug = str(meta.get("slug") or path.stem)
+    if not valid_slug(slug):
+        raise ValueError(f"slug {slug!r} must match ^[a-z0-9-]+$")
+
+    return {
+        "slug": slug,
+        "title": str(title),
+        "excerpt": meta.get("excerpt"),
+        "content": body.strip() + "\n",
+        "author": meta.get("author") or "Anonymous",
+        "tags": [str(t) for t in tags],
+        "is_published": is_published,
+        "published_at": published_at,
+    }
+
+
+def scan(directory: Path):
+    """Yield (path, source_hash, raw bytes) for every markdown file"""
+    for path in sorted(directory.rglob("*.md")):
+        data = path.read_bytes()
+        yield path, hashlib.sha256(data).hexdigest(), data
+
+
+def import_directory(directory, dry_run: bool = False) -> dict:
+    """
+    Sync every markdown file under directory into flog_articles.
+    Returns a summary including the slugs that were written.
+    """
+    directory = Path(directory).resolve()
+    summary = {"scanned": 0, "unchanged": 0, "inserted": 0, "updated": 0, "errors": [], "slugs": []}
+
+    files = list(scan(directory))
+    summary["scanned"] = len(files)
+    articles = []
+    files_by_slug = {}
+    for path, source_hash, data in files:
+        name = str(path.relative_to(directory))
+        try:
+            article = parse_article(path, data.decode("utf-8"))
+            if article["slug"] in files_by_slug:
+                raise ValueError(f"slug {article['slug']!r} is already used by {files_by_slug[article['slug']]}")
+        except Exception as e:
+            summary["errors"].append({"file": name, "error": str(e)})
+            continue
+        files_by_slug[article["slug"]] = name
+        article["source_hash"] = source_hash
+        articles.append(article)
+
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT slug, source_hash FROM flog_articles WHERE slug = ANY(%s)",
+                ([a["slug"] for a in articles],),
+            )
+            existing = dict(cur.fetchall())
+
+            changed = [a for a in articles if existing.get(a["slug"]) != a["source_hash"]]
+            summary["unchanged"] = len(articles) - len(changed)
+            if dry_run or not changed:
+                summary["slugs"] = [a["slug"] for a in changed]
+                return summary
+
+            cur.execute("""
+                CREATE TEMP TABLE flog_import_staging (
+                    slug TEXT, title TEXT, excerpt TEXT, content TEXT, author TEXT,
+                    tags TEXT[], is_published BOOLEAN, published_at TIMESTAMP,
+                    content_html TEXT, content_hash TEXT, word_count INTEGER,
+                    reading_time_min INTEGER, toc JSONB, source_hash TEXT
+                ) ON COMMIT DROP
+            """)
+            with cur.copy(f"COPY flog_import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN") as copy:
+                for a in changed:
+                    a.update(render_article(a["content"]))
+                    a["toc"] = psycopg.types.json.Jsonb(a["toc"])
+                    copy.write_row(tuple(a[col] for col in STAGING_COLUMNS))
+
+            updatable = [c for c in STAGING_COLUMNS if c not in ("slug", "published_at")]
+            # NOW() only for rows that will be inserted; updates keep the stored date
+            select = [
+                """CASE WHEN s.published_at IS NULL AND s.is_published
+                        AND NOT EXISTS (SELECT 1 FROM flog_articles a WHERE a.slug = s.slug)
+                   THEN NOW() ELSE s.published_at END""" if c == "published_at" else f"s.{c}"
+                for c in STAGING_COLUMNS
+            ]
+            cur.execute(f"""
+                INSERT INTO flog_articles ({', '.join(STAGING_COLUMNS)})
+                SELECT {', '.join(select)} FROM flog_import_staging s
+                ON CONFLICT (slug) DO UPDATE SET
+                    {', '.join(f"{c} = EXCLUDED.{c}" for c in updatable)},
+                    published_at = COALESCE(EXCLUDED.published_at, flog_articles.published_at,
+                                            CASE WHEN EXCLUDED.is_published THEN NOW() END),
+                    updated_at = NOW()
+                WHERE flog_articles.source_hash IS DISTINCT FROM EXCLUDED.source_hash
+                RETURNING slug, (xmax = 0) AS inserted
+            """)
+            for slug, inserted in cur.fetchall():
+                summary["inserted" if inserted else "updated"] += 1
+                summary["slugs"].append(slug)
+        conn.commit()
+
+    return summary
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    result = import_directory(args[0] if args else IMPORT_ROOT, dry_run="--dry-run" in sys.argv)
+    if result["slugs"] and "--dry-run" not in sys.argv:
+        from flog_api import _queue_article_jobs
+        _queue_article_jobs(*result["slugs"])
+    for err in result["errors"]:
+        print(f"error: {err['file']}: {err['error']}")
+    print(f"scanned {result['scanned']}, unchanged {result['unchanged']}, "
+          f"inserted {result['inserted']}, updated {result['updated']}")
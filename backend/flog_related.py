@@ -0,0 +1,126 @@
+"""
+Related-article index for the Flog.
+
+Builds a TF-IDF matrix over published articles and stores each article's
+top-k cosine neighbours in flog_related, so /articles/<slug>/related is a
+primary-key lookup at request time.
+
+Article writes enqueue `refresh(slugs)`, which re-vectorizes the corpus (one
+sparse pass) but only recomputes neighbour lists that can have changed: the
+written articles, lists that contained them, lists the written articles now
+beat, and lists that are short because a neighbour was deleted.
+
+    DB_URL=postgresql://... python flog_related.py rebuild
+"""
+import os
+import sys
+
+import numpy as np
+import psycopg
+
+from text_analysis import tokenize, term_counts, tfidf, top_k_cosine
+
+DB_URL = os.environ.get("DB_URL")
+TOP_K = int(os.environ.get("FLOG_RELATED_K", "5"))
+
+
+def _conn():
+    if not DB_URL:
+        raise RuntimeError("DB_URL not configured")
+    return psycopg.connect(DB_URL)
+
+
+def _vectorize(cur):
+    cur.execute("""
+        SELECT id, slug, title, excerpt, content
+        FROM flog_articles
+        WHERE is_published = true AND published_at <= NOW()
+        ORDER BY id
+    """)
+    rows = cur.fetchall()
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    slugs = [r[1] for r in rows]
+    # Title and excerpt are repeated to weight them above body text
+    docs = (tokenize(f"{r[2]} {r[2]} {r[3] or ''} {r[3] or ''} {r[4]}") for r in rows)
+    counts, _ = term_counts(docs)
+    return ids, slugs, tfidf(counts)
+
+
+def _write_lists(cur, ids, neighbours, replace_rows):
+    cur.execute("DELETE FROM flog_related WHERE article_id = ANY(%s)", ([int(ids[r]) for r in replace_rows],))
+    with cur.copy("COPY flog_related (article_id, related_id, score, rank) FROM STDIN") as copy:
+        for row in replace_rows:
+            top, scores = neighbours[row]
+            for rank, (col, score) in enumerate(zip(top, scores), start=1):
+                if score <= 0:
+                    break
+                copy.write_row((int(ids[row]), int(ids[col]), float(score), rank))
+
+
+def rebuild_all(k: int = TOP_K) -> int:
+    """Recompute every neighbour list"""
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            ids, _, matrix = _vectorize(cur)
+            neighbours = top_k_cosine(matrix, k)
+            cur.execute("DELETE FROM flog_related")
+            _write_lists(cur, ids, neighbours, list(neighbours))
+        conn.commit()
+    return len(ids)
+
+
+def refresh(slugs, k: int = TOP_K) -> int:
+    """Incrementally update neighbour lists after writes to these slugs"""
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            ids, slugs_in_corpus, matrix = _vectorize(cur)
+            if not len(ids):
+                cur.execute("DELETE FROM flog_related")
+                conn.commit()
+                return 0
+            position = {int(i): p for p, i in enumerate(ids)}
+            wanted = set(slugs)
+            changed = [p for p, s in enumerate(slugs_in_corpus) if s in wanted]
+            changed_ids = [int(ids[p]) for p in changed]
+
+            # Drop lists of articles that are no longer published
+            cur.execute("DELETE FROM flog_related WHERE NOT (article_id = ANY(%s))", ([int(i) for i in ids],))
+
+            # Current list state: weakest score and length per article, and who lists a changed
+            # article or one that has left the corpus (unpublished or scheduled, not deleted)
+            cur.execute("""
+                SELECT article_id, MIN(score), COUNT(*),
+                       bool_or(related_id = ANY(%s) OR NOT (related_id = ANY(%s)))
+                FROM flog_related
+                GROUP BY article_id
+            """, (changed_ids, [int(i) for i in ids]))
+            state = {row[0]: row[1:] for row in cur.fetchall()}
+
+            expected = min(k, len(ids) - 1)
+            affected = set(changed)
+            for article_id, p in position.items():
+                weakest, length, lists_changed = state.get(article_id, (None, 0, False))
+                if lists_changed or length < expected:
+                    affected.add(p)
+
+            if changed:
+                # Similarity of each written article to everything else, in one product
+                sims = (matrix[changed] @ matrix.T).toarray().max(axis=0)
+                for article_id, (weakest, length, _) in state.items():
+                    p = position.get(article_id)
+                    if p is not None and p not in affected and sims[p] > weakest:
+                        affected.add(p)
+
+            affected = sorted(affected)
+            if affected:
+                neighbours = top_k_cosine(matrix, k, rows=affected)
+                _write_lists(cur, ids, neighbours, affected)
+        conn.commit()
+    return len(affected)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(1)
+    print(f"indexed {rebuild_all()} article(s)")
@@ -0,0 +1,120 @@
+"""
+Markdown rendering for Flog articles.
+
+Articles are rendered to sanitized HTML once, when they are written, and the
+result is stored next to the markdown source in flog_articles. Readers get
+content_html, a table of contents and reading stats without re-parsing.
+
+Backfill existing rows:
+    DB_URL=postgresql://... python flog_render.py backfill [--force]
+"""
+import hashlib
+import math
+import os
+import re
+import sys
+
+import markdown
+import nh3
+import psycopg
+
+WORDS_PER_MINUTE = 230
+
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "toc"]
+
+# nh3 defaults plus heading ids, so table-of-contents anchors survive sanitizing
+ALLOWED_ATTRIBUTES = {tag: set(attrs) for tag, attrs in nh3.ALLOWED_ATTRIBUTES.items()}
+for _heading in ("h1", "h2", "h3", "h4", "h5", "h6"):
+    ALLOWED_ATTRIBUTES.setdefault(_heading, set()).add("id")
+
+# Slugs name files in the static snapshot (flog_static.py), so nothing else is allowed
+SLUG_RE = re.compile(r"^[a-z0-9-]+$")
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"[\w'’-]+")
+
+
+def valid_slug(slug) -> bool:
+    return isinstance(slug, str) and bool(SLUG_RE.match(slug))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def _toc_entries(tokens):
+    return [
+        {
+            "id": t["id"],
+            "title": t["name"],
+            "level": t["level"],
+            "children": _toc_entries(t.get("children", [])),
+        }
+        for t in tokens
+    ]
+
+
+def render_article(content: str) -> dict:
+    """Render markdown source to the derived columns stored on flog_articles"""
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    html = nh3.clean(md.convert(content or ""), attributes=ALLOWED_ATTRIBUTES)
+    words = len(_WORD_RE.findall(_TAG_RE.sub(" ", html)))
+    return {
+        "content_html": html,
+        "content_hash": content_hash(content),
+        "word_count": words,
+        "reading_time_min": max(1, math.ceil(words / WORDS_PER_MINUTE)) if words else 0,
+        "toc": _toc_entries(md.toc_tokens),
+    }
+
+
+def backfill(db_url: str, force: bool = False, batch_size: int = 100) -> int:
+    """Render every row whose stored HTML is missing (or all rows with force)"""
+    updated = 0
+    last_id = 0
+    with psycopg.connect(db_url) as conn:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("""
+                    SELECT id, content, content_hash
+                    FROM flog_articles
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s
+                """, (last_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                batch = []
+                for article_id, content, stored_hash in rows:
+                    if not force and stored_hash == content_hash(content):
+                        continue
+                    r = render_article(content)
+                    batch.append((
+                        r["content_html"], r["content_hash"], r["word_count"],
+                        r["reading_time_min"], psycopg.types.json.Jsonb(r["toc"]),
+                        article_id,
+                    ))
+                if batch:
+                    cur.executemany("""
+                        UPDATE flog_articles
+                        SET content_html = %s, content_hash = %s, word_count = %s,
+                            reading_time_min = %s, toc = %s
+                        WHERE id = %s
+                    """, batch)
+                    conn.commit()
+                    updated += len(batch)
+    return updated
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print(__doc__)
+        sys.exit(1)
+    db_url = os.environ.get("DB_URL")
+    if not db_url:
+        raise RuntimeError("DB_URL not configured")
+    count = backfill(db_url, force="--force" in sys.argv[2:])
+    print(f"rendered {count} article(s)")
@@ -0,0 +1,294 @@
+"""
+Static snapshot export of the Flog for CDN/edge serving.
+
+Layout under FLOG_STATIC_DIR:
+    current -> snapshots/<id>      (symlink, swapped atomically)
+    snapshots/<id>/index.json       summaries of all published articles
+    snapshots/<id>/feed.xml         Atom feed
+    snapshots/<id>/sitemap.xml
+    snapshots/<id>/articles/<slug>.json
+    snapshots/<id>/articles/<slug>.html
+
+A full build renders everything. Article writes enqueue `regenerate(slugs)`,
+which hard-links the current snapshot into a new directory, rewrites only the
+affected per-slug files plus the (small) index/feed/sitemap, and swaps the
+symlink. Readers never see a half-written snapshot.
+
+Articles scheduled with a future published_at are left out until they go
+live; `publish_due()` adds them to the snapshot once they have. Run it
+periodically (the `schedule` command loops every FLOG_PUBLISH_CHECK_SEC).
+
+    DB_URL=postgresql://... python flog_static.py build
+    DB_URL=postgresql://... python flog_static.py schedule
+"""
+import fcntl
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg
+from jinja2 import Environment
+
+import flog_related
+from flog_render import valid_slug
+
+DB_URL = os.environ.get("DB_URL")
+STATIC_DIR = Path(os.environ.get("FLOG_STATIC_DIR", "/srv/flog-static"))
+PUBLIC_BASE_URL = os.environ.get("FLOG_PUBLIC_BASE_URL", "").rstrip("/")
+KEEP_SNAPSHOTS = int(os.environ.get("FLOG_STATIC_KEEP", "3"))
+PUBLISH_CHECK_SEC = float(os.environ.get("FLOG_PUBLISH_CHECK_SEC", "60"))
+
+SUMMARY_COLUMNS = ("id", "slug", "title", "excerpt", "author", "tags",
+                   "word_count", "reading_time_min", "published_at", "updated_at")
+ARTICLE_COLUMNS = SUMMARY_COLUMNS + ("content", "content_html", "toc")
+
+_env = Environment(autoescape=True)
+
+ARTICLE_HTML = _env.from_string("""<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>{{ a.title }}</title>
+  <meta name="description" content="{{ a.excerpt or '' }}">
+  <link rel="alternate" type="application/atom+xml" href="{{ base }}/feed.xml">
+</head>
+<body>
+  <article>
+    <h1>{{ a.title }}</h1>
+    <p class="byline">{{ a.author }}{% if a.published_at %} · <time datetime="{{ a.published_at }}">{{ a.published_at[:10] }}</time>{% endif %}{% if a.reading_time_min %} · {{ a.reading_time_min }} min read{% endif %}</p>
+    {{ a.content_html | safe }}
+  </article>
+</body>
+</html>
+""")
+
+ATOM_FEED = _env.from_string("""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>The Flog</title>
+  <id>{{ base }}/</id>
+  <link rel="self" href="{{ base }}/feed.xml"/>
+  <updated>{{ updated }}</updated>
+{% for a in articles %}  <entry>
+    <title>{{ a.title }}</title>
+    <id>{{ base }}/articles/{{ a.slug }}.html</id>
+    <link href="{{ base }}/articles/{{ a.slug }}.html"/>
+    <author><name>{{ a.author or 'Anonymous' }}</name></author>
+    <published>{{ a.published_at }}</published>
+    <updated>{{ a.updated_at or a.published_at }}</updated>
+    <summary>{{ a.excerpt or '' }}</summary>
+  </entry>
+{% endfor %}</feed>
+""")
+
+SITEMAP = _env.from_string("""<?xml version="1.0" encoding="utf-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+{% for a in articles %}  <url><loc>{{ base }}/articles/{{ a.slug }}.html</loc><lastmod>{{ (a.updated_at or a.published_at)[:10] }}</lastmod></url>
+{% endfor %}</urlset>
+""")
+
+
+def _conn():
+    if not DB_URL:
+        raise RuntimeError("DB_URL not configured")
+    return psycopg.connect(DB_URL)
+
+
+def _iso(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+def _fetch(cur, columns, where="", params=()):
+    cur.execute(f"""
+        SELECT {', '.join(columns)}
+        FROM flog_articles
+        WHERE is_published = true AND published_at <= NOW() {where}
+        ORDER BY published_at DESC, id DESC
+    """, params)
+    rows = [
+        {col: _iso(val) for col, val in zip(columns, row)}
+        for row in cur.fetchall()
+    ]
+    # Slugs become file names; one that slipped past validation is never written
+    for row in rows:
+        if not valid_slug(row["slug"]):
+            print(f"flog_static: skipping article {row['id']} with invalid slug {row['slug']!r}", flush=True)
+    return [row for row in rows if valid_slug(row["slug"])]
+
+
+def _write(path: Path, data: str):
+    """Write via temp file + rename so a hard-linked original is never modified"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _article_path(root: Path, slug: str, ext: str) -> Path:
+    if not valid_slug(slug):
+        raise ValueError(f"invalid slug {slug!r}")
+    return root / "articles" / f"{slug}.{ext}"
+
+
+def _write_article(root: Path, article: dict):
+    _write(_article_path(root, article["slug"], "json"), json.dumps(article))
+    _write(_article_path(root, article["slug"], "html"), ARTICLE_HTML.render(a=article, base=PUBLIC_BASE_URL))
+
+
+def _write_listings(root: Path, summaries: list):
+    updated = max((a["updated_at"] or a["published_at"] for a in summaries), default=_iso(datetime.now(timezone.utc)))
+    _write(root / "index.json", json.dumps({"generated_at": _iso(datetime.now(timezone.utc)), "articles": summaries}))
+    _write(root / "feed.xml", ATOM_FEED.render(articles=summaries[:50], base=PUBLIC_BASE_URL, updated=updated))
+    _write(root / "sitemap.xml", SITEMAP.render(articles=summaries, base=PUBLIC_BASE_URL))
+
+
+@contextmanager
+def _locked():
+    STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    with open(STATIC_DIR / ".lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _new_snapshot_dir() -> Path:
+    path = STATIC_DIR / "snapshots" / f"{time.time_ns()}"
+    path.mkdir(parents=True)
+    return path
+
+
+def _clone(src: Path, dst: Path):
+    """Populate dst with hard links to every file in src (cheap, no copying)"""
+    shutil.copytree(src, dst, copy_function=os.link, dirs_exist_ok=True)
+
+
+def _swap(snapshot: Path):
+    current = STATIC_DIR / "current"
+    tmp_link = STATIC_DIR / "current.tmp"
+    if tmp_link.is_symlink():
+        tmp_link.unlink()
+    tmp_link.symlink_to(snapshot.relative_to(STATIC_DIR))
+    os.replace(tmp_link, current)
+
+    snapshots = sorted((STATIC_DIR / "snapshots").iterdir(), key=lambda p: p.name)
+    for old in snapshots[:-KEEP_SNAPSHOTS]:
+        if old != snapshot:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def build_full():
+    """Render a complete snapshot from the database and publish it"""
+    with _locked():
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                articles = _fetch(cur, ARTICLE_COLUMNS)
+        snapshot = _new_snapshot_dir()
+        for article in articles:
+            _write_article(snapshot, article)
+        _write_listings(snapshot, [{k: a[k] for k in SUMMARY_COLUMNS} for a in articles])
+        _swap(snapshot)
+        return len(articles)
+
+
+def regenerate(slugs):
+    """
+    Incrementally publish a new snapshot after writes to the given slugs.
+    Slugs that are no longer published (deleted, unpublished, renamed away)
+    have their files removed. Queued by flog_api on every article write.
+    """
+    current = STATIC_DIR / "current"
+    if not current.exists():
+        return build_full()
+
+    slugs = sorted(set(s for s in slugs if valid_slug(s)))
+    with _locked():
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                summaries = _fetch(cur, SUMMARY_COLUMNS)
+                changed = _fetch(cur, ARTICLE_COLUMNS, "AND slug = ANY(%s)", (slugs,)) if slugs else []
+
+        snapshot = _new_snapshot_dir()
+        _clone(current.resolve(), snapshot)
+
+        published = {a["slug"] for a in changed}
+        for slug in slugs:
+            if slug not in published:
+                for ext in ("json", "html"):
+                    _article_path(snapshot, slug, ext).unlink(missing_ok=True)
+        for article in changed:
+            _write_article(snapshot, article)
+        _write_listings(snapshot, summaries)
+        _swap(snapshot)
+        return len(changed)
+
+
+def publish_due():
+    """
+    Publish articles whose published_at has passed since they were last
+    written. Going live is not a write, so nothing else notices it:
+    - their updated_at is moved up to published_at, which makes the
+      change_seq trigger stamp them again for /api/flog/changes clients
+    - they are added to the static snapshot (as is any visible article the
+      current index.json is missing) and to the related-article index
+    Returns the slugs published.
+    """
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE flog_articles SET updated_at = published_at
+                WHERE is_published = true AND published_at <= NOW()
+                  AND (updated_at IS NULL OR updated_at < published_at)
+                RETURNING slug
+            """)
+            went_live = {row[0] for row in cur.fetchall()}
+            visible = {a["slug"] for a in _fetch(cur, ("id", "slug"))}
+        conn.commit()
+
+    current = STATIC_DIR / "current"
+    try:
+        listed = {a["slug"] for a in json.loads((current / "index.json").read_text())["articles"]}
+    except (OSError, ValueError, KeyError):
+        build_full()
+        listed = visible
+    due = sorted(went_live | (visible - listed))
+    if due:
+        regenerate(due)
+    if went_live:
+        flog_related.refresh(sorted(went_live))
+    return due
+
+
+def run_schedule():
+    """publish_due() every PUBLISH_CHECK_SEC, until killed"""
+    while True:
+        try:
+            due = publish_due()
+            if due:
+                print(f"flog_static: published {', '.join(due)}", flush=True)
+        except Exception as e:
+            print(f"flog_static: {e}", flush=True)
+        time.sleep(PUBLISH_CHECK_SEC)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "regenerate", "publish-due", "schedule"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "build":
+        print(f"exported {build_full()} article(s) to {STATIC_DIR / 'current'}")
+    elif sys.argv[1] == "regenerate":
+        print(f"regenerated {regenerate(sys.argv[2:])} article(s)")
+    elif sys.argv[1] == "publish-due":
+        print(f"published {len(publish_due())} scheduled article(s)")
+    else:
+        run_schedule()
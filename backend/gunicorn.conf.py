@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for the events API (loaded automatically from the working directory).
+"""
+import os
+import shutil
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+
+# Threaded workers: a request waiting on Postgres, Redis or a 10s Mailgun call
+# holds one thread, not the whole worker. The shared clients are thread-safe:
+# redis-py clients pool their connections, Postgres connections are borrowed
+# from db.connection()'s per-worker pool (DB_POOL_MAX defaults to the thread
+# count), and Mailgun/Square calls use requests per call. Set
+# GUNICORN_WORKER_CLASS=sync to go back to one request per worker.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# gunicorn silently turns sync into gthread when threads > 1
+threads = int(os.environ.get("GUNICORN_THREADS", "8")) if worker_class == "gthread" else 1
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+
+# Per-worker metric files, aggregated by /metrics (see metrics.py). Must be
+# set before the workers import prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+# Imported up front: child_exit runs from the master's SIGCHLD handler and
+# can re-enter itself, which breaks a first import made there
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Samples from a previous run must not be summed into this one
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
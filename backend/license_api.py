@@ -0,0 +1,307 @@
+"""
+License API endpoints: Square payment webhook, provisioning intake, rosters,
+seats and bulk entitlement checks.
+"""
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+from datetime import datetime, timezone
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import psycopg
+
+from admin import require_admin
+from db import warm_license_cache, bulk_entitlements
+from license_roster import load_roster, LicenseNotFound
+import license_seats
+from metrics import TimedRedis
+import tracing
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+SQUARE_WEBHOOK_SECRET = os.environ.get("SQUARE_WEBHOOK_SECRET")
+# Must match the notification URL configured in the Square dashboard exactly;
+# it is part of the signed payload
+SQUARE_WEBHOOK_URL = os.environ.get("SQUARE_WEBHOOK_URL")
+
+MAX_CHECK_PAIRS = int(os.environ.get("ENTITLEMENT_CHECK_MAX", "50000"))
+CHECK_CHUNK = 5000
+
+PROVISION_QUEUE = "license:provision:queue"
+# Payments the provisioner could not turn into a license, with the reason
+PROVISION_DEAD_LETTER = "license:provision:dead"
+ORDER_SEEN_KEY = "square:order:{order_id}"
+ORDER_SEEN_TTL = 7 * 86400
+
+r = TimedRedis.from_url(REDIS_URL)
+
+license_bp = Blueprint('license', __name__, url_prefix='/api')
+
+
+def _valid_square_signature(body: bytes, signature: str) -> bool:
+    digest = hmac.new(SQUARE_WEBHOOK_SECRET.encode(), SQUARE_WEBHOOK_URL.encode() + body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature or "")
+
+
+@license_bp.route('/square/webhook', methods=['POST'])
+def square_webhook():
+    """
+    Square payment webhook. Completed payments are queued for
+    license_provisioner.py; nothing here touches Postgres, so a purchase
+    burst costs one Redis round trip per notification.
+    """
+    if not (SQUARE_WEBHOOK_SECRET and SQUARE_WEBHOOK_URL):
+        return ("signing key missing", 400)
+    body = request.get_data()
+    if not _valid_square_signature(body, request.headers.get("X-Square-Hmacsha256-Signature")):
+        return ("invalid signature", 403)
+
+    try:
+        event = json.loads(body)
+    except Exception:
+        return jsonify({"ok": False, "error": "invalid json"}), 400
+
+    if event.get("type") not in ("payment.created", "payment.updated"):
+        return ("ignored", 200)
+    payment = (event.get("data") or {}).get("object", {}).get("payment") or {}
+    order_id = payment.get("order_id")
+    if payment.get("status") != "COMPLETED" or not order_id:
+        return ("ignored", 200)
+
+    # Square retries and sends both created/updated; only the first
+    # completed notification per order is queued
+    seen_key = ORDER_SEEN_KEY.format(order_id=order_id)
+    if not r.set(seen_key, event.get("event_id") or 1, nx=True, ex=ORDER_SEEN_TTL):
+        return ("duplicate", 200)
+    try:
+        r.rpush(PROVISION_QUEUE, json.dumps(tracing.inject({
+            "order_id": order_id,
+            "payment_id": payment.get("id"),
+            "buyer_email": payment.get("buyer_email_address"),
+            "amount": (payment.get("amount_money") or {}).get("amount"),
+            "received_at": datetime.now(timezone.utc).isoformat(),
+        })))
+    except Exception:
+        # Let Square redeliver
+        r.delete(seen_key)
+        return ("queue unavailable", 503)
+    return ("ok", 200)
+
+
+def _warm(emails):
+    """Refresh cached licenses after a committed change; never fails the request"""
+    try:
+        warm_license_cache(emails)
+    except Exception as e:
+        # Only a cache: readers fall back to Postgres
+        print(f"license_api: warming the license cache failed: {e}", flush=True)
+
+
+@license_bp.route('/licenses/<int:license_id>/roster', methods=['POST'])
+def upload_roster(license_id):
+    """
+    POST /api/licenses/<license_id>/roster?overflow=reject|truncate
+    Admin only (X-Admin-Key). Body is CSV (text/csv, or a multipart "file"),
+    one email per row, optionally with an "email" header column.
+    """
+    err = require_admin()
+    if err:
+        return err
+
+    overflow = request.args.get("overflow", "reject")
+    if overflow not in ("reject", "truncate"):
+        return jsonify({"ok": False, "error": "overflow must be reject or truncate"}), 400
+
+    upload = request.files.get("file")
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        summary = load_roster(license_id, stream, overflow=overflow)
+    except LicenseNotFound:
+        return jsonify({"ok": False, "error": "license not found"}), 404
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    added = summary.pop("added_emails")
+    if added:
+        _warm(added)
+    if "error" in summary:
+        return jsonify({"ok": False, "error": summary.pop("error"), "roster": summary}), 409
+    return jsonify({"ok": True, "roster": summary})
+
+
+@license_bp.route('/licenses/<int:license_id>/seats', methods=['GET'])
+def get_seats(license_id):
+    """
+    GET /api/licenses/<license_id>/seats
+    Admin only (X-Admin-Key). Served from the Redis seat mirror.
+    """
+    err = require_admin()
+    if err:
+        return err
+    try:
+        seats = license_seats.seats(license_id)
+        if seats is None:
+            return jsonify({"ok": False, "error": "license not found"}), 404
+        return jsonify({"ok": True, "seats": seats})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
+@license_bp.route('/licenses/<int:license_id>/users', methods=['POST', 'DELETE'])
+def change_users(license_id):
+    """
+    POST|DELETE /api/licenses/<license_id>/users
+    Admin only (X-Admin-Key). Adds or removes a few users; use the roster
+    upload for large lists. Additions are all-or-nothing against seat_limit.
+
+    Request body:
+    {"emails": ["a@uni.edu", "b@uni.edu"]}
+    """
+    err = require_admin()
+    if err:
+        return err
+    data = request.get_json(silent=True) or {}
+    emails = data.get("emails") or []
+    if not isinstance(emails, list) or not emails:
+        return jsonify({"ok": False, "error": "emails must be a non-empty list"}), 400
+
+    try:
+        if request.method == "POST":
+            changed = license_seats.add_users(license_id, emails)
+        else:
+            changed = license_seats.remove_users(license_id, emails)
+        _warm(changed)
+        return jsonify({
+            "ok": True,
+            "added" if request.method == "POST" else "removed": changed,
+            "seats": license_seats.seats(license_id)
+        })
+    except license_seats.SeatLimitExceeded:
+        return jsonify({
+            "ok": False,
+            "error": "seat limit reached",
+            "seats": license_seats.seats(license_id)
+        }), 409
+    except psycopg.errors.ForeignKeyViolation:
+        return jsonify({"ok": False, "error": "license not found"}), 404
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
+_INVALID_LINE = object()
+
+
+def _check_pair(item):
+    """(email, host) for one check; ValueError if it isn't one"""
+    if item is _INVALID_LINE:
+        raise ValueError("invalid json line")
+    if not isinstance(item, dict):
+        raise ValueError("check must be an object with email and host")
+    email = item.get("email")
+    host = item.get("host")
+    if not isinstance(email, str) or not email.strip():
+        raise ValueError("email must be a non-empty string")
+    if host is not None and not isinstance(host, str):
+        raise ValueError("host must be a string")
+    return email.strip().lower(), (host or "").strip().lower()
+
+
+def _check_pairs(items):
+    """Returns (pairs, per-item errors as {"index", "error"}) in input order"""
+    pairs = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            pairs.append(_check_pair(item))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+    return pairs, errors
+
+
+def _stream_checks(stream):
+    """Resolve NDJSON input CHECK_CHUNK lines at a time (one lookup per chunk)"""
+    chunk = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except Exception:
+            # Kept in the chunk so its error line comes out in input order
+            chunk.append(_INVALID_LINE)
+        if len(chunk) >= CHECK_CHUNK:
+            yield from _stream_results(chunk)
+            chunk = []
+    if chunk:
+        yield from _stream_results(chunk)
+
+
+def _stream_results(chunk):
+    pairs, errors = _check_pairs(chunk)
+    results = iter(zip(pairs, bulk_entitlements(pairs)))
+    failed = {e["index"]: e["error"] for e in errors}
+    # One output line per input line, invalid checks included
+    for index in range(len(chunk)):
+        if index in failed:
+            yield json.dumps({"error": failed[index]}) + "\n"
+            continue
+        (email, host), entitled = next(results)
+        yield json.dumps({"email": email, "host": host, "entitled": entitled}) + "\n"
+
+
+@license_bp.route('/entitlements/check', methods=['POST'])
+def check_entitlements():
+    """
+    POST /api/entitlements/check
+    Admin only (X-Admin-Key). Same answer as /api/authz's entitlement step,
+    for many users at once.
+
+    JSON body, either form:
+    {"checks": [{"email": "a@uni.edu", "host": "book.example.com"}, ...]}
+    {"host": "book.example.com", "emails": ["a@uni.edu", ...]}
+
+    Response: {"ok": true, "results": {"<host>": {"<email>": true, ...}}}
+
+    For very large inputs send application/x-ndjson, one {"email", "host"}
+    per line; results stream back as NDJSON in input order.
+    """
+    err = require_admin()
+    if err:
+        return err
+
+    if request.mimetype == "application/x-ndjson":
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8", errors="replace")
+        return Response(stream_with_context(_stream_checks(stream)), mimetype="application/x-ndjson")
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"ok": False, "error": "body must be a JSON object"}), 400
+    if "emails" in data:
+        emails = data.get("emails") or []
+        if not isinstance(emails, list):
+            return jsonify({"ok": False, "error": "emails must be a list"}), 400
+        items = [{"email": e, "host": data.get("host")} for e in emails]
+    else:
+        items = data.get("checks") or []
+        if not isinstance(items, list):
+            return jsonify({"ok": False, "error": "checks must be a list"}), 400
+    if len(items) > MAX_CHECK_PAIRS:
+        return jsonify({
+            "ok": False,
+            "error": f"at most {MAX_CHECK_PAIRS} checks per request; use application/x-ndjson"
+        }), 413
+
+    try:
+        pairs, errors = _check_pairs(items)
+        results = {}
+        for (email, host), entitled in zip(pairs, bulk_entitlements(pairs)):
+            results.setdefault(host, {})[email] = entitled
+        body = {"ok": True, "results": results}
+        if errors:
+            body["errors"] = errors
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
@@ -0,0 +1,306 @@
+"""
+Background license provisioning for completed Square payments.
+
+POST /api/square/webhook pushes completed payments onto the Redis list
+license:provision:queue. This process drains it in batches:
+
+1. one Square orders/batch-retrieve call per batch, for the tier the store
+   put in the order metadata
+2. one transaction per batch: multi-row INSERT into licenses
+   (ON CONFLICT (order_id) DO NOTHING) and license_users
+3. after commit: warm the license cache for the buyers, queue a
+   license.provisioned event (welcome email) per license not yet announced,
+   mark those licenses announced_at, then trim the queue
+
+Like tou_writer.py, items are only removed after the commit, so a crash
+re-delivers the batch and the order_id unique constraint makes the retry a
+no-op. Payments that can never become a license (order unknown to Square,
+no buyer email, missing or unknown tier, bad seat count) are logged and moved
+to license:provision:dead instead of blocking the queue; Square outages and
+lost connections leave the batch queued.
+
+Between batches it also drains license_cache_invalidations, deleting the
+licenses:<email> cache entries of licenses changed anywhere else (including
+by hand in SQL). Run exactly one provisioner per queue:
+
+    DB_URL=postgresql://... SQUARE_ACCESS_TOKEN=... python license_provisioner.py
+"""
+import json
+import os
+import signal
+import time
+from datetime import datetime, timezone
+
+import psycopg
+import redis
+import requests
+from rq import Queue
+
+from db import LICENSE_INVALIDATE_BATCH, _tier_entitlements, drain_license_invalidations, warm_license_cache
+from license_api import PROVISION_DEAD_LETTER, PROVISION_QUEUE
+from metrics import TimedCursor
+import tracing
+
+DB_URL = os.environ.get("DB_URL")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+SQUARE_ACCESS_TOKEN = os.environ.get("SQUARE_ACCESS_TOKEN")
+SQUARE_LOCATION_ID = os.environ.get("SQUARE_LOCATION_ID")
+SQUARE_BASE = os.environ.get("SQUARE_BASE", "https://connect.squareup.com")
+SQUARE_VERSION = os.environ.get("SQUARE_VERSION", "2024-09-26")
+BATCH_SIZE = int(os.environ.get("LICENSE_PROVISION_BATCH", "100"))  # batch-retrieve takes up to 100 orders
+IDLE_SLEEP = float(os.environ.get("LICENSE_PROVISION_IDLE_SEC", "0.5"))
+
+TIERS = ("individual", "academic", "corporate", "government", "nonprofit")
+# seat_limit for orders without "seats" metadata; other tiers are unlimited
+TIER_SEATS = {"nonprofit": int(os.environ.get("NONPROFIT_MIN_USERS", "10"))}
+
+r = redis.from_url(REDIS_URL)
+q = Queue("events", connection=r)
+square = requests.Session()
+square.headers.update({
+    "Authorization": f"Bearer {SQUARE_ACCESS_TOKEN}",
+    "Content-Type": "application/json",
+    "Square-Version": SQUARE_VERSION,
+})
+
+_running = True
+
+
+def _stop(signum, frame):
+    global _running
+    _running = False
+
+
+def _conn():
+    if not DB_URL:
+        raise RuntimeError("DB_URL not configured")
+    return psycopg.connect(DB_URL, cursor_factory=TimedCursor)
+
+
+def _dead_letter(item, error) -> str:
+    if isinstance(item, bytes):
+        item = item.decode("utf-8", "replace")
+    order_id = item.get("order_id") if isinstance(item, dict) else None
+    print(f"license_provisioner: dead-lettering order {order_id}: {error}", flush=True)
+    return json.dumps({
+        "item": item,
+        "error": str(error),
+        "failed_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def _dedupe(items):
+    """
+    One record per order_id.
+    Returns (records, dead letters for items that could not be parsed).
+    """
+    by_order = {}
+    dead = []
+    for raw in items:
+        try:
+            rec = json.loads(raw)
+        except Exception as e:
+            dead.append(_dead_letter(raw, e))
+            continue
+        if not isinstance(rec, dict) or not rec.get("order_id"):
+            dead.append(_dead_letter(raw, "no order_id"))
+            continue
+        by_order.setdefault(rec["order_id"], rec)
+    return list(by_order.values()), dead
+
+
+def _rejected(e) -> bool:
+    """A 4xx that retrying will not fix (429 is a rate limit, so it is retried)"""
+    status = e.response.status_code if e.response is not None else None
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def fetch_orders(order_ids) -> dict:
+    """order_id -> Square order, in one API call"""
+    with tracing.span("square.orders.batch_retrieve", "client", orders=len(order_ids)) as span:
+        resp = square.post(
+            f"{SQUARE_BASE}/v2/orders/batch-retrieve",
+            json={"location_id": SQUARE_LOCATION_ID, "order_ids": order_ids},
+            timeout=(3.05, 15),
+        )
+        span.set(**{"http.status_code": resp.status_code})
+        resp.raise_for_status()
+    return {o["id"]: o for o in resp.json().get("orders", [])}
+
+
+def _fetch_each(records):
+    """
+    Fallback when Square rejects a whole batch: one order per call, so one
+    bad order_id doesn't hold up the others. Returns (orders, dead letters
+    by order_id).
+    """
+    orders = {}
+    dead = {}
+    for rec in records:
+        try:
+            orders.update(fetch_orders([rec["order_id"]]))
+        except requests.HTTPError as e:
+            if not _rejected(e):
+                raise
+            dead[rec["order_id"]] = _dead_letter(rec, f"Square rejected the order: {e}")
+    return orders, dead
+
+
+def _license_row(rec, order):
+    """(tier, order_id, email, seat_limit) for one payment; ValueError if it can't be provisioned"""
+    metadata = order.get("metadata") or {}
+    email = (rec.get("buyer_email") or metadata.get("buyer_email") or "").strip()
+    if not email:
+        raise ValueError("no buyer email")
+    tier = (metadata.get("tier") or "").lower()
+    if tier not in TIERS:
+        raise ValueError(f"tier {tier!r} is not one of {', '.join(TIERS)}")
+    seats = metadata.get("seats")
+    if seats in (None, ""):
+        seats = TIER_SEATS.get(tier)
+    else:
+        try:
+            seats = int(seats)
+        except (TypeError, ValueError):
+            raise ValueError(f"seats {seats!r} is not a number")
+        if seats < 1:
+            raise ValueError(f"seats {seats} is below 1")
+    return tier, rec["order_id"], email, seats
+
+
+def _license_rows(records, orders):
+    """Returns (rows, dead letters for payments that can't be provisioned)"""
+    rows = []
+    dead = []
+    for rec in records:
+        order = orders.get(rec["order_id"])
+        if order is None:
+            dead.append(_dead_letter(rec, "order not returned by Square"))
+            continue
+        try:
+            rows.append(_license_row(rec, order))
+        except ValueError as e:
+            dead.append(_dead_letter(rec, e))
+    return rows, dead
+
+
+def provision_batch(conn, rows):
+    """
+    Insert licenses and their owner seats. Returns the batch's licenses that
+    have not been announced yet: the new ones, plus any whose announcement
+    failed on an earlier attempt.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO licenses (license_tier, order_id, owner_email, seat_limit)
+            SELECT * FROM unnest(%s::text[], %s::text[], %s::text[], %s::int[])
+            ON CONFLICT (order_id) DO NOTHING
+            RETURNING id, license_tier, owner_email, order_id
+        """, (
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows],
+        ))
+        created = cur.fetchall()
+        if created:
+            cur.execute("""
+                INSERT INTO license_users (license_id, email)
+                SELECT * FROM unnest(%s::int[], %s::text[])
+                ON CONFLICT DO NOTHING
+            """, ([c[0] for c in created], [c[2] for c in created]))
+        cur.execute("""
+            SELECT id, license_tier, owner_email, order_id
+            FROM licenses
+            WHERE order_id = ANY(%s) AND announced_at IS NULL
+            ORDER BY id
+        """, ([row[1] for row in rows],))
+        pending = cur.fetchall()
+    conn.commit()
+    return pending
+
+
+def mark_announced(conn, license_ids):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE licenses SET announced_at = NOW() WHERE id = ANY(%s)", (list(license_ids),))
+    conn.commit()
+
+
+def _announce(created, traceparents):
+    ent = _tier_entitlements()
+    now = datetime.now(timezone.utc).isoformat()
+    for license_id, tier, email, order_id in created:
+        scopes = ent.get(tier, [])
+        # Continue the trace of the Square webhook that queued this order
+        with tracing.span("rq.enqueue worker.handle_event", "producer", traceparents.get(order_id),
+                          **{"event.type": "license.provisioned"}):
+            q.enqueue("worker.handle_event", tracing.inject({
+                "type": "license.provisioned",
+                "license_id": license_id,
+                "tier": tier,
+                "user": {"email": email},
+                "entitlements": {scope: True for scope in scopes},
+                "received_at": now,
+            }))
+
+
+def flush_once(conn) -> int:
+    """Provision up to BATCH_SIZE queued payments; returns how many were read"""
+    items = r.lrange(PROVISION_QUEUE, 0, BATCH_SIZE - 1)
+    if not items:
+        return 0
+    records, dead = _dedupe(items)
+    with tracing.span("license.provision_batch", items=len(items), orders=len(records)):
+        if records:
+            try:
+                orders = fetch_orders([rec["order_id"] for rec in records])
+            except requests.HTTPError as e:
+                if not _rejected(e):
+                    raise
+                orders, rejected = _fetch_each(records)
+                dead += rejected.values()
+                records = [rec for rec in records if rec["order_id"] not in rejected]
+            rows, invalid = _license_rows(records, orders)
+            dead += invalid
+            pending = provision_batch(conn, rows) if rows else []
+            if pending:
+                try:
+                    warm_license_cache(sorted({c[2] for c in pending}))
+                except Exception as e:
+                    # Only a cache: readers fall back to Postgres
+                    print(f"license_provisioner: warming the license cache failed: {e}", flush=True)
+                # If queueing fails the batch stays queued and is announced on the retry;
+                # a crash before mark_announced can repeat a welcome email, never lose one
+                _announce(pending, {rec["order_id"]: rec.get("traceparent") for rec in records})
+                mark_announced(conn, [c[0] for c in pending])
+        pipe = r.pipeline()
+        if dead:
+            pipe.rpush(PROVISION_DEAD_LETTER, *dead)
+        pipe.ltrim(PROVISION_QUEUE, len(items), -1)
+        pipe.execute()
+    return len(items)
+
+
+def run():
+    tracing.instrument()
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    conn = None
+    while _running:
+        try:
+            if conn is None or conn.closed:
+                conn = _conn()
+            read = flush_once(conn)
+            invalidated = drain_license_invalidations(conn)
+            if read < BATCH_SIZE and invalidated < LICENSE_INVALIDATE_BATCH:
+                time.sleep(IDLE_SLEEP)
+        except Exception as e:
+            print(f"license_provisioner: {e}", flush=True)
+            if conn is not None:
+                conn.close()
+            conn = None
+            time.sleep(2)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,139 @@
+"""
+Bulk roster upload for multi-seat (academic, nonprofit) licenses.
+
+A roster is CSV with one email per row: either a header row with an "email"
+column, or no header and the email in the first column. The upload is
+parsed in a single streaming pass (normalize, validate, dedupe) straight
+into COPY, so the whole roster reaches Postgres in one round trip:
+
+    COPY -> temp roster_stage -> seat check -> INSERT ... ON CONFLICT DO NOTHING
+
+The seat limit is enforced set-wise against the whole upload: with
+overflow="reject" (default) nothing is added if the new emails don't fit,
+with overflow="truncate" the first emails in file order are added up to
+the limit. The seat triggers keep licenses.seats_used in step (see
+license_seats.py).
+"""
+import csv
+import re
+
+from db import connection
+from license_seats import mirror
+
+EMAIL_RE = re.compile(r"^[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+$")
+
+
+class LicenseNotFound(Exception):
+    pass
+
+
+def _conn():
+    return connection()
+
+
+def normalize_email(value: str) -> str | None:
+    email = (value or "").strip().strip('"').lower()
+    if len(email) > 254 or not EMAIL_RE.match(email):
+        return None
+    return email
+
+
+def iter_roster(stream, stats):
+    """Yield (ord, email) for each new valid email; counts the rest in stats"""
+    reader = csv.reader(stream)
+    column = 0
+    seen = set()
+    first = True
+    for row in reader:
+        # A byte order mark is not whitespace to str.strip()
+        row = [cell.replace("\ufeff", "") for cell in row]
+        if not any(cell.strip() for cell in row):
+            continue
+        if first:
+            first = False
+            header = [cell.strip().lower() for cell in row]
+            if "email" in header:
+                column = header.index("email")
+                continue
+        stats["received"] += 1
+        email = normalize_email(row[column] if column < len(row) else "")
+        if email is None:
+            stats["invalid"] += 1
+            if len(stats["invalid_samples"]) < 10:
+                stats["invalid_samples"].append(row[column] if column < len(row) else "")
+            continue
+        if email in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(email)
+        yield len(seen), email
+
+
+def load_roster(license_id: int, stream, overflow: str = "reject") -> dict:
+    """Add the emails in a CSV text stream to a license; returns a summary"""
+    stats = {
+        "license_id": license_id,
+        "received": 0,
+        "invalid": 0,
+        "invalid_samples": [],
+        "duplicates": 0,
+        "already_present": 0,
+        "added": 0,
+        "not_added": 0,
+        "seat_limit": None,
+        "seats_used": 0,
+        "added_emails": [],
+    }
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM licenses WHERE id = %s", (license_id,))
+            if cur.fetchone() is None:
+                raise LicenseNotFound(license_id)
+
+            cur.execute("CREATE TEMP TABLE roster_stage (ord INTEGER, email TEXT) ON COMMIT DROP")
+            with cur.copy("COPY roster_stage (ord, email) FROM STDIN") as copy:
+                for row in iter_roster(stream, stats):
+                    copy.write_row(row)
+            cur.execute("ANALYZE roster_stage")
+
+            # Serialize roster changes per license while we count seats
+            cur.execute("SELECT seat_limit, seats_used FROM licenses WHERE id = %s FOR UPDATE", (license_id,))
+            seat_limit, used = cur.fetchone()
+            cur.execute("""
+                SELECT COUNT(*) FROM roster_stage s
+                WHERE NOT EXISTS (SELECT 1 FROM license_users u
+                                  WHERE u.license_id = %s AND LOWER(u.email) = s.email)
+            """, (license_id,))
+            new = cur.fetchone()[0]
+            stats["seat_limit"] = seat_limit
+            stats["already_present"] = stats["received"] - stats["invalid"] - stats["duplicates"] - new
+
+            limit = None
+            if seat_limit is not None and used + new > seat_limit:
+                if overflow != "truncate":
+                    conn.rollback()
+                    stats["seats_used"] = used
+                    stats["not_added"] = new
+                    stats["error"] = f"roster needs {new} seats, {max(seat_limit - used, 0)} available"
+                    return stats
+                limit = max(seat_limit - used, 0)
+
+            cur.execute("""
+                INSERT INTO license_users (license_id, email)
+                SELECT %(id)s, s.email
+                FROM roster_stage s
+                WHERE NOT EXISTS (SELECT 1 FROM license_users u
+                                  WHERE u.license_id = %(id)s AND LOWER(u.email) = s.email)
+                ORDER BY s.ord
+                LIMIT %(limit)s
+                ON CONFLICT (license_id, email) DO NOTHING
+                RETURNING email
+            """, {"id": license_id, "limit": limit})
+            stats["added_emails"] = [r[0] for r in cur.fetchall()]
+        conn.commit()
+
+    stats["added"] = len(stats["added_emails"])
+    stats["not_added"] = new - stats["added"]
+    stats["seats_used"] = used + stats["added"]
+    mirror([(license_id, stats["seats_used"], seat_limit)])
+    return stats
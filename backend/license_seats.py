@@ -0,0 +1,196 @@
+"""
+Seat accounting for multi-seat licenses.
+
+licenses.seats_used is maintained by statement-level triggers on
+license_users (migrations/011_add_license_seats.sql). The triggers that add
+seats check seat_limit (migrations/014_relax_license_seat_check.sql), so an
+addition that would go over the limit fails as a whole, however many writers
+race; removals always succeed. The counter is mirrored in Redis
+(seats:<license_id> -> {used, limit}) for GET .../seats; the mirror is
+refreshed after every change made here and rebuilt by reconcile(), which
+also repairs any drift between seats_used and license_users:
+
+    DB_URL=postgresql://... python license_seats.py reconcile
+"""
+import argparse
+import os
+
+import psycopg
+
+from db import connection
+from metrics import TimedRedis
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+SEATS_KEY = "seats:{license_id}"
+SEATS_TTL = int(os.environ.get("LICENSE_SEATS_TTL", "86400"))
+RECONCILE_BATCH = 500
+
+r = TimedRedis.from_url(REDIS_URL)
+
+
+class SeatLimitExceeded(Exception):
+    pass
+
+
+def _conn():
+    return connection()
+
+
+def mirror(rows):
+    """Write (license_id, seats_used, seat_limit) rows to Redis"""
+    try:
+        pipe = r.pipeline(transaction=False)
+        for license_id, used, limit in rows:
+            key = SEATS_KEY.format(license_id=license_id)
+            pipe.hset(key, mapping={"used": used, "limit": "" if limit is None else limit})
+            pipe.expire(key, SEATS_TTL)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _load(cur, license_ids):
+    cur.execute("SELECT id, seats_used, seat_limit FROM licenses WHERE id = ANY(%s)", (list(license_ids),))
+    return cur.fetchall()
+
+
+def seats(license_id: int) -> dict | None:
+    """{"used": n, "limit": n or None, "available": n or None}; None if no such license"""
+    try:
+        cached = r.hgetall(SEATS_KEY.format(license_id=license_id))
+    except Exception:
+        cached = None
+    if cached:
+        used = int(cached[b"used"])
+        limit = int(cached[b"limit"]) if cached[b"limit"] else None
+    else:
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                rows = _load(cur, [license_id])
+        if not rows:
+            return None
+        mirror(rows)
+        _, used, limit = rows[0]
+    return {"used": used, "limit": limit, "available": None if limit is None else max(limit - used, 0)}
+
+
+def add_users(license_id: int, emails) -> list:
+    """
+    Add users to a license in one statement; returns the emails added.
+    Raises SeatLimitExceeded (nothing added) if they don't all fit.
+    """
+    emails = sorted({e.strip().lower() for e in emails if e and e.strip()})
+    # No shortcut through the Redis mirror: it can be stale, and emails already
+    # on the license take no seat. The seat trigger decides.
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("""
+                    INSERT INTO license_users (license_id, email)
+                    SELECT %s, e FROM unnest(%s::text[]) AS e
+                    WHERE NOT EXISTS (SELECT 1 FROM license_users u
+                                      WHERE u.license_id = %s AND LOWER(u.email) = e)
+                    ON CONFLICT (license_id, email) DO NOTHING
+                    RETURNING email
+                """, (license_id, emails, license_id))
+            except psycopg.errors.CheckViolation:
+                conn.rollback()
+                # On this connection: borrowing a second one could exhaust the pool
+                mirror(_load(cur, [license_id]))
+                raise SeatLimitExceeded(license_id)
+            added = [row[0] for row in cur.fetchall()]
+            rows = _load(cur, [license_id])
+        conn.commit()
+    mirror(rows)
+    return added
+
+
+def remove_users(license_id: int, emails) -> list:
+    """Remove users from a license, freeing their seats; returns the emails removed"""
+    emails = [e.strip().lower() for e in emails if e and e.strip()]
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM license_users
+                WHERE license_id = %s AND LOWER(email) = ANY(%s)
+                RETURNING email
+            """, (license_id, emails))
+            removed = [row[0] for row in cur.fetchall()]
+            rows = _load(cur, [license_id])
+        conn.commit()
+    mirror(rows)
+    return removed
+
+
+def refresh(*license_ids):
+    """Re-read counters from Postgres into the Redis mirror"""
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            mirror(_load(cur, license_ids))
+
+
+def reconcile() -> dict:
+    """
+    Recount license_users, fix drifted seats_used values and rebuild the
+    Redis mirror. Each batch locks its license rows first, so the recount
+    cannot miss a concurrent addition (the seat triggers need those locks).
+    """
+    summary = {"licenses": 0, "repaired": [], "over_limit": []}
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM licenses ORDER BY id")
+            ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+
+        for i in range(0, len(ids), RECONCILE_BATCH):
+            batch = ids[i:i + RECONCILE_BATCH]
+            with conn.cursor() as cur:
+                cur.execute("SELECT id FROM licenses WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (batch,))
+                cur.execute("""
+                    WITH counts AS (
+                        SELECT l.id, l.seat_limit, COUNT(u.license_id) AS n
+                        FROM licenses l
+                        LEFT JOIN license_users u ON u.license_id = l.id
+                        WHERE l.id = ANY(%s)
+                        GROUP BY l.id
+                    )
+                    SELECT id, n FROM counts WHERE seat_limit IS NOT NULL AND n > seat_limit
+                """, (batch,))
+                # Predate the seat triggers or had seat_limit lowered; left for an admin to resolve
+                summary["over_limit"].extend(row[0] for row in cur.fetchall())
+                cur.execute("""
+                    UPDATE licenses l
+                    SET seats_used = c.n
+                    FROM (
+                        SELECT l.id, COUNT(u.license_id) AS n
+                        FROM licenses l
+                        LEFT JOIN license_users u ON u.license_id = l.id
+                        WHERE l.id = ANY(%s)
+                        GROUP BY l.id
+                    ) c
+                    WHERE l.id = c.id
+                      AND l.seats_used <> c.n
+                    RETURNING l.id
+                """, (batch,))
+                summary["repaired"].extend(row[0] for row in cur.fetchall())
+                rows = _load(cur, batch)
+            conn.commit()
+            mirror(rows)
+            summary["licenses"] += len(batch)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="License seat accounting")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("reconcile", help="Repair seats_used drift and rebuild the Redis mirror")
+    args = parser.parse_args()
+
+    if args.command == "reconcile":
+        summary = reconcile()
+        print(f"checked {summary['licenses']} licenses, repaired {len(summary['repaired'])}"
+              + (f", over limit: {summary['over_limit']}" if summary["over_limit"] else ""))
+
+
+if __name__ == "__main__":
+    main()
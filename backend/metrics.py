@@ -0,0 +1,223 @@
+"""
+Prometheus metrics for the events API, served at /metrics.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so every
+worker writes its samples to shared mmap files and /metrics aggregates them
+(whichever worker answers the scrape). Without it (flask run, RQ worker,
+CLIs) the default in-process registry is used.
+
+- request latency/counts per blueprint and route, via init_app()
+- DB query timings via TimedCursor: psycopg.connect(..., cursor_factory=TimedCursor)
+- Redis round trips via TimedRedis.from_url()
+- Mailgun latency and outcomes (email_mailgun.send_mailgun)
+- cache hit/miss counters (cache_result())
+- RQ and Redis-list queue depth and oldest-item age, computed at scrape time
+"""
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import psycopg
+import redis
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+MULTIPROC = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ["blueprint", "route", "method"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by status",
+    ["blueprint", "route", "method", "status"],
+)
+DB_LATENCY = Histogram(
+    "db_query_duration_seconds", "Postgres statement latency",
+    ["operation"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+DB_ERRORS = Counter("db_query_errors_total", "Postgres statements that raised", ["operation"])
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Redis round-trip latency",
+    ["command"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25),
+)
+MAILGUN_LATENCY = Histogram(
+    "mailgun_request_duration_seconds", "Mailgun API call latency",
+    ["template"],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+MAILGUN_REQUESTS = Counter("mailgun_requests_total", "Mailgun API calls by outcome", ["template", "outcome"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result", ["cache", "result"])
+
+_OPERATIONS = {"select", "insert", "update", "delete", "with", "copy", "create", "analyze"}
+
+
+def _operation(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode(errors="replace")
+    if not isinstance(query, str):
+        return "other"
+    word = query.lstrip().split(None, 1)[0].lower() if query.strip() else ""
+    return word if word in _OPERATIONS else "other"
+
+
+# Called as listener(cursor, query, params, seconds, failed) after every
+# TimedCursor statement; querystats.py registers one for per-request accounting
+query_listeners = []
+# listener(command, seconds, failed) after every TimedRedis round trip
+redis_listeners = []
+
+
+class TimedCursor(psycopg.Cursor):
+    """psycopg cursor that records every statement in db_query_duration_seconds"""
+
+    def _timed(self, run, query, params):
+        op = _operation(query)
+        start = time.perf_counter()
+        failed = False
+        try:
+            return run()
+        except Exception:
+            failed = True
+            DB_ERRORS.labels(op).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_LATENCY.labels(op).observe(elapsed)
+            for listener in query_listeners:
+                listener(self, query, params, elapsed, failed)
+
+    def execute(self, query, params=None, **kwargs):
+        return self._timed(lambda: super(TimedCursor, self).execute(query, params, **kwargs), query, params)
+
+    def executemany(self, query, params_seq, **kwargs):
+        return self._timed(lambda: super(TimedCursor, self).executemany(query, params_seq, **kwargs), query, None)
+
+
+class TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return super().execute(raise_on_error)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            REDIS_LATENCY.labels("PIPELINE").observe(elapsed)
+            for listener in redis_listeners:
+                listener("PIPELINE", elapsed, failed)
+
+
+class TimedRedis(redis.Redis):
+    """Redis client that records every round trip in redis_command_duration_seconds"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return super().execute_command(*args, **options)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            command = str(args[0]).split()[0].upper()
+            REDIS_LATENCY.labels(command).observe(elapsed)
+            for listener in redis_listeners:
+                listener(command, elapsed, failed)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def cache_result(cache: str, result: str, count: int = 1):
+    """Count a cache lookup; result is "hit", "miss" or a layer name"""
+    CACHE_REQUESTS.labels(cache, result).inc(count)
+
+
+class QueueCollector:
+    """Depth and oldest-item age of RQ queues and JSON Redis lists, read at scrape time"""
+
+    def __init__(self, connection, rq_queues=(), lists=None):
+        self.connection = connection
+        self.rq_queues = list(rq_queues)
+        self.lists = dict(lists or {})  # list key -> timestamp field in each item
+
+    def collect(self):
+        depth = GaugeMetricFamily("queue_depth", "Items waiting in a queue", labels=["queue"])
+        age = GaugeMetricFamily("queue_oldest_age_seconds", "Age of the oldest waiting item", labels=["queue"])
+        now = datetime.now(timezone.utc)
+        for queue in self.rq_queues:
+            try:
+                depth.add_metric([queue.name], queue.count)
+                job_ids = queue.get_job_ids(0, 1)
+                job = queue.fetch_job(job_ids[0]) if job_ids else None
+                enqueued_at = job.enqueued_at if job else None
+                if enqueued_at is not None and enqueued_at.tzinfo is None:
+                    enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+                age.add_metric([queue.name], (now - enqueued_at).total_seconds() if enqueued_at else 0)
+            except Exception:
+                continue
+        for key, field in self.lists.items():
+            try:
+                depth.add_metric([key], self.connection.llen(key))
+                head = self.connection.lindex(key, 0)
+                ts = datetime.fromisoformat(json.loads(head)[field]) if head else None
+                if ts is not None and ts.tzinfo is None:
+                    ts = ts.replace(tzinfo=timezone.utc)
+                age.add_metric([key], (now - ts).total_seconds() if ts else 0)
+            except Exception:
+                continue
+        yield depth
+        yield age
+
+
+def _route_labels():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    return request.blueprint or "app", rule, request.method
+
+
+def init_app(app, connection=None, rq_queues=(), lists=None):
+    """Time every request and serve /metrics"""
+    queues_registry = CollectorRegistry()
+    if connection is not None:
+        queues_registry.register(QueueCollector(connection, rq_queues, lists))
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None and request.endpoint != "metrics":
+            blueprint, route, method = _route_labels()
+            REQUEST_LATENCY.labels(blueprint, route, method).observe(time.perf_counter() - start)
+            REQUESTS.labels(blueprint, route, method, str(response.status_code)).inc()
+        return response
+
+    def metrics():
+        if METRICS_TOKEN:
+            token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+            if not hmac.compare_digest(token.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+                return ("unauthorized", 401)
+        if MULTIPROC:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        body = generate_latest(registry) + generate_latest(queues_registry)
+        return Response(body, content_type=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,15 @@
+-- Full-text search over Flog articles
+-- Stored generated tsvector: title (A) > excerpt (B) > content (C)
+ALTER TABLE flog_articles
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(excerpt, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'C')
+    ) STORED;
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_flog_search ON flog_articles USING GIN(search_vector);
+
+-- Comments
+COMMENT ON COLUMN flog_articles.search_vector IS 'Weighted tsvector of title/excerpt/content, maintained by Postgres';
@@ -0,0 +1,45 @@
+-- Flog tag filtering and facet counts
+
+-- GIN index so `tags @> ARRAY[...]` filters avoid a sequential scan
+CREATE INDEX IF NOT EXISTS idx_flog_tags ON flog_articles USING GIN(tags);
+
+-- Per-tag count of published articles, maintained by trigger
+CREATE TABLE IF NOT EXISTS flog_tag_counts (
+    tag TEXT PRIMARY KEY,
+    article_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION flog_tag_counts_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_published AND OLD.tags IS NOT NULL THEN
+        UPDATE flog_tag_counts c
+        SET article_count = c.article_count - 1
+        FROM (SELECT DISTINCT unnest(OLD.tags) AS tag) t
+        WHERE c.tag = t.tag;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_published AND NEW.tags IS NOT NULL THEN
+        INSERT INTO flog_tag_counts (tag, article_count)
+        SELECT DISTINCT unnest(NEW.tags), 1
+        ON CONFLICT (tag) DO UPDATE SET article_count = flog_tag_counts.article_count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flog_tag_counts ON flog_articles;
+CREATE TRIGGER trg_flog_tag_counts
+    AFTER INSERT OR DELETE OR UPDATE OF tags, is_published ON flog_articles
+    FOR EACH ROW EXECUTE FUNCTION flog_tag_counts_sync();
+
+-- Backfill from existing rows
+INSERT INTO flog_tag_counts (tag, article_count)
+SELECT tag, COUNT(*)
+FROM flog_articles, LATERAL (SELECT DISTINCT unnest(tags) AS tag) t
+WHERE is_published = true
+GROUP BY tag
+ON CONFLICT (tag) DO UPDATE SET article_count = EXCLUDED.article_count;
+
+-- Comments
+COMMENT ON TABLE flog_tag_counts IS 'Published article count per tag (trigger-maintained; scheduled articles count once is_published is set)';
@@ -0,0 +1,13 @@
+-- Pre-rendered article HTML and derived fields (populated by flog_render.py)
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS content_html TEXT;
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS word_count INTEGER;
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS reading_time_min INTEGER;
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS toc JSONB;
+
+-- Comments
+COMMENT ON COLUMN flog_articles.content_html IS 'Sanitized HTML rendered from content at write time';
+COMMENT ON COLUMN flog_articles.content_hash IS 'SHA-256 of content; content_html is stale when this does not match';
+COMMENT ON COLUMN flog_articles.toc IS 'Table of contents: nested [{id, title, level, children}]';
+
+-- Existing rows: run `python flog_render.py backfill` after applying this migration
@@ -0,0 +1,49 @@
+-- Delta-sync support for Flog: monotonic change cursor + delete tombstones
+CREATE SEQUENCE IF NOT EXISTS flog_change_seq;
+
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS change_seq BIGINT;
+UPDATE flog_articles SET change_seq = nextval('flog_change_seq') WHERE change_seq IS NULL;
+
+CREATE TABLE IF NOT EXISTS flog_tombstones (
+    change_seq BIGINT PRIMARY KEY,
+    article_id INTEGER NOT NULL,
+    slug TEXT NOT NULL,
+    deleted_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_flog_change_seq ON flog_articles(change_seq);
+
+-- Stamp every write with the next change_seq. Writers take a transaction-level
+-- advisory lock first, so sequence order equals commit order and a reader can
+-- never see seq N+1 before seq N is visible (article writes are rare admin
+-- operations, so the serialization costs nothing in practice).
+CREATE OR REPLACE FUNCTION flog_change_stamp() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('flog_change_seq'));
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO flog_tombstones (change_seq, article_id, slug)
+        VALUES (nextval('flog_change_seq'), OLD.id, OLD.slug);
+        RETURN OLD;
+    END IF;
+
+    -- A renamed article leaves a tombstone for its old slug
+    IF TG_OP = 'UPDATE' AND NEW.slug IS DISTINCT FROM OLD.slug THEN
+        INSERT INTO flog_tombstones (change_seq, article_id, slug)
+        VALUES (nextval('flog_change_seq'), OLD.id, OLD.slug);
+    END IF;
+
+    NEW.change_seq := nextval('flog_change_seq');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_flog_change_stamp ON flog_articles;
+CREATE TRIGGER trg_flog_change_stamp
+    BEFORE INSERT OR UPDATE OR DELETE ON flog_articles
+    FOR EACH ROW EXECUTE FUNCTION flog_change_stamp();
+
+-- Comments
+COMMENT ON COLUMN flog_articles.change_seq IS 'Position in the Flog change feed (GET /api/flog/changes)';
+COMMENT ON TABLE flog_tombstones IS 'Deleted or renamed-away article slugs for delta-sync clients';
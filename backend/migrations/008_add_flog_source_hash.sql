@@ -0,0 +1,5 @@
+-- Bulk markdown import: remember which source file version each article came from
+ALTER TABLE flog_articles ADD COLUMN IF NOT EXISTS source_hash TEXT;
+
+-- Comments
+COMMENT ON COLUMN flog_articles.source_hash IS 'SHA-256 of the imported markdown file (front matter + body); unchanged files are skipped';
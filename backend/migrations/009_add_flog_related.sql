@@ -0,0 +1,14 @@
+-- Precomputed related articles (maintained by flog_related.py)
+CREATE TABLE IF NOT EXISTS flog_related (
+    article_id INTEGER NOT NULL REFERENCES flog_articles(id) ON DELETE CASCADE,
+    rank SMALLINT NOT NULL,
+    related_id INTEGER NOT NULL REFERENCES flog_articles(id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    PRIMARY KEY (article_id, rank)
+);
+
+-- Indexes
+CREATE INDEX IF NOT EXISTS idx_flog_related_related ON flog_related(related_id);
+
+-- Comments
+COMMENT ON TABLE flog_related IS 'Top-k TF-IDF cosine neighbours per article; run `python flog_related.py rebuild` after applying';
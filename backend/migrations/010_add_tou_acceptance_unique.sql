@@ -0,0 +1,12 @@
+-- One acceptance row per (email, version); repeated accepts become upserts
+
+-- Remove duplicates left by earlier inserts, keeping the first acceptance
+DELETE FROM tou_acceptances a
+USING tou_acceptances b
+WHERE LOWER(a.email) = LOWER(b.email)
+  AND a.tou_version = b.tou_version
+  AND a.id > b.id;
+
+-- Indexes
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tou_acceptances_email_version
+    ON tou_acceptances(LOWER(email), tou_version);
@@ -0,0 +1,79 @@
+-- Seat accounting for licenses.seat_limit
+
+-- Seats taken per license, maintained by the statement-level triggers below
+ALTER TABLE licenses ADD COLUMN IF NOT EXISTS seats_used INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from existing rows
+UPDATE licenses l
+SET seats_used = c.n
+FROM (SELECT license_id, COUNT(*) AS n FROM license_users GROUP BY license_id) c
+WHERE l.id = c.license_id;
+
+-- An insert that would take a license over its limit fails as a whole.
+-- NOT VALID: existing over-limit licenses are left alone, new writes are checked.
+ALTER TABLE licenses DROP CONSTRAINT IF EXISTS licenses_seats_within_limit;
+ALTER TABLE licenses ADD CONSTRAINT licenses_seats_within_limit
+    CHECK (seats_used >= 0 AND (seat_limit IS NULL OR seats_used <= seat_limit)) NOT VALID;
+
+-- One UPDATE per statement and license, however many rows the statement
+-- touched. The UPDATE takes the license row lock, so concurrent additions to
+-- the same license serialize on it and each sees the other's count.
+CREATE OR REPLACE FUNCTION license_seats_added() RETURNS trigger AS $$
+BEGIN
+    UPDATE licenses l
+    SET seats_used = l.seats_used + d.n
+    FROM (SELECT license_id, COUNT(*) AS n FROM added GROUP BY license_id ORDER BY license_id) d
+    WHERE l.id = d.license_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_seats_removed() RETURNS trigger AS $$
+BEGIN
+    UPDATE licenses l
+    SET seats_used = l.seats_used - d.n
+    FROM (SELECT license_id, COUNT(*) AS n FROM removed GROUP BY license_id ORDER BY license_id) d
+    WHERE l.id = d.license_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_seats_moved() RETURNS trigger AS $$
+BEGIN
+    UPDATE licenses l
+    SET seats_used = l.seats_used + d.n
+    FROM (
+        SELECT license_id, SUM(n) AS n
+        FROM (SELECT license_id, 1 AS n FROM added
+              UNION ALL
+              SELECT license_id, -1 FROM removed) x
+        GROUP BY license_id
+        HAVING SUM(n) <> 0
+        ORDER BY license_id
+    ) d
+    WHERE l.id = d.license_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow a single event per trigger
+DROP TRIGGER IF EXISTS trg_license_seats_insert ON license_users;
+CREATE TRIGGER trg_license_seats_insert
+    AFTER INSERT ON license_users
+    REFERENCING NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION license_seats_added();
+
+DROP TRIGGER IF EXISTS trg_license_seats_delete ON license_users;
+CREATE TRIGGER trg_license_seats_delete
+    AFTER DELETE ON license_users
+    REFERENCING OLD TABLE AS removed
+    FOR EACH STATEMENT EXECUTE FUNCTION license_seats_removed();
+
+DROP TRIGGER IF EXISTS trg_license_seats_update ON license_users;
+CREATE TRIGGER trg_license_seats_update
+    AFTER UPDATE ON license_users
+    REFERENCING OLD TABLE AS removed NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION license_seats_moved();
+
+-- Comments
+COMMENT ON COLUMN licenses.seats_used IS 'Rows in license_users for this license (trigger-maintained; license_seats.py reconcile repairs drift)';
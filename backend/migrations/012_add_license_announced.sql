@@ -0,0 +1,11 @@
+-- Welcome-email bookkeeping for license_provisioner.py
+
+-- Set once the license.provisioned event is queued. Until then the
+-- provisioner keeps the order queued and announces it again on retry.
+ALTER TABLE licenses ADD COLUMN IF NOT EXISTS announced_at TIMESTAMP;
+
+-- Licenses from before this migration have already been announced
+UPDATE licenses SET announced_at = created_at WHERE announced_at IS NULL;
+
+-- Comments
+COMMENT ON COLUMN licenses.announced_at IS 'When the license.provisioned event (welcome email) was queued; NULL = not yet';
@@ -0,0 +1,72 @@
+-- Invalidation queue for the licenses:<email> Redis cache (db.py)
+
+-- Any change to who holds a license, or to a license's tier, status or
+-- expiry, queues the affected emails here, including changes made by hand in
+-- SQL. license_provisioner.py drains the table and deletes their cache entries.
+CREATE TABLE IF NOT EXISTS license_cache_invalidations (
+    id BIGSERIAL PRIMARY KEY,
+    email TEXT NOT NULL,
+    queued_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION license_cache_changed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO license_cache_invalidations (email)
+    SELECT email FROM license_users WHERE license_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_users_cache_added() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO license_cache_invalidations (email) SELECT email FROM added;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_users_cache_removed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO license_cache_invalidations (email) SELECT email FROM removed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_users_cache_moved() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO license_cache_invalidations (email)
+    SELECT email FROM removed UNION SELECT email FROM added;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- seats_used changes on every seat write and is not cached, so it is not watched
+DROP TRIGGER IF EXISTS trg_license_cache_update ON licenses;
+CREATE TRIGGER trg_license_cache_update
+    AFTER UPDATE OF is_active, expiration_date, license_tier ON licenses
+    FOR EACH ROW
+    WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active
+          OR OLD.expiration_date IS DISTINCT FROM NEW.expiration_date
+          OR OLD.license_tier IS DISTINCT FROM NEW.license_tier)
+    EXECUTE FUNCTION license_cache_changed();
+
+-- Deleting a license cascades to license_users, which the delete trigger covers
+DROP TRIGGER IF EXISTS trg_license_users_cache_insert ON license_users;
+CREATE TRIGGER trg_license_users_cache_insert
+    AFTER INSERT ON license_users
+    REFERENCING NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION license_users_cache_added();
+
+DROP TRIGGER IF EXISTS trg_license_users_cache_delete ON license_users;
+CREATE TRIGGER trg_license_users_cache_delete
+    AFTER DELETE ON license_users
+    REFERENCING OLD TABLE AS removed
+    FOR EACH STATEMENT EXECUTE FUNCTION license_users_cache_removed();
+
+DROP TRIGGER IF EXISTS trg_license_users_cache_update ON license_users;
+CREATE TRIGGER trg_license_users_cache_update
+    AFTER UPDATE ON license_users
+    REFERENCING OLD TABLE AS removed NEW TABLE AS added
+    FOR EACH STATEMENT EXECUTE FUNCTION license_users_cache_moved();
+
+-- Comments
+COMMENT ON TABLE license_cache_invalidations IS 'Emails whose licenses:<email> cache entry is stale; drained by license_provisioner.py';
@@ -0,0 +1,61 @@
+-- Enforce seat limits on additions only
+--
+-- The NOT VALID CHECK from 011 is still evaluated on every UPDATE of a
+-- licenses row, so a license that was over its limit before 011 could not
+-- lose a seat or be deactivated. The limit moves into the triggers that add
+-- seats; removals and other updates are always allowed.
+ALTER TABLE licenses DROP CONSTRAINT IF EXISTS licenses_seats_within_limit;
+ALTER TABLE licenses DROP CONSTRAINT IF EXISTS licenses_seats_nonnegative;
+ALTER TABLE licenses ADD CONSTRAINT licenses_seats_nonnegative CHECK (seats_used >= 0);
+
+-- Raised as check_violation with the old constraint name, so callers that
+-- catch CheckViolation keep working
+CREATE OR REPLACE FUNCTION license_seats_added() RETURNS trigger AS $$
+DECLARE
+    over INTEGER;
+BEGIN
+    WITH updated AS (
+        UPDATE licenses l
+        SET seats_used = l.seats_used + d.n
+        FROM (SELECT license_id, COUNT(*) AS n FROM added GROUP BY license_id ORDER BY license_id) d
+        WHERE l.id = d.license_id
+        RETURNING l.id, l.seats_used, l.seat_limit
+    )
+    SELECT id INTO over FROM updated WHERE seat_limit IS NOT NULL AND seats_used > seat_limit LIMIT 1;
+    IF over IS NOT NULL THEN
+        RAISE EXCEPTION 'license % is over its seat limit', over
+            USING ERRCODE = 'check_violation', CONSTRAINT = 'licenses_seats_within_limit';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION license_seats_moved() RETURNS trigger AS $$
+DECLARE
+    over INTEGER;
+BEGIN
+    WITH updated AS (
+        UPDATE licenses l
+        SET seats_used = l.seats_used + d.n
+        FROM (
+            SELECT license_id, SUM(n) AS n
+            FROM (SELECT license_id, 1 AS n FROM added
+                  UNION ALL
+                  SELECT license_id, -1 FROM removed) x
+            GROUP BY license_id
+            HAVING SUM(n) <> 0
+            ORDER BY license_id
+        ) d
+        WHERE l.id = d.license_id
+        RETURNING l.id, l.seats_used, l.seat_limit, d.n
+    )
+    SELECT id INTO over FROM updated
+    WHERE n > 0 AND seat_limit IS NOT NULL AND seats_used > seat_limit
+    LIMIT 1;
+    IF over IS NOT NULL THEN
+        RAISE EXCEPTION 'license % is over its seat limit', over
+            USING ERRCODE = 'check_violation', CONSTRAINT = 'licenses_seats_within_limit';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,206 @@
+"""
+On-demand request profiling for the events API.
+
+Two modes, both writing into PROFILE_DIR (shared by the gunicorn workers):
+
+- cProfile, per request: requests carrying "X-Profile: 1" plus a valid
+  X-Admin-Key, and a random PROFILE_SAMPLE_RATE fraction of all requests,
+  run under cProfile. Each one is saved as
+  <time>-<route>-<pid>.pstats and the response gets an X-Profile-Id header.
+  One profiled request at a time per worker; others run normally.
+
+- statistical sampler, always on when PROFILE_SAMPLER=true: a thread grabs
+  the stack of every in-flight request every PROFILE_SAMPLER_INTERVAL
+  seconds and every PROFILE_SAMPLER_FLUSH_SEC writes one collapsed-stack
+  file per route (<time>-<route>-<pid>.folded), ready for flamegraph.pl or
+  speedscope. Cost is one sys._current_frames() call per tick.
+
+Admin endpoints:
+    GET /api/admin/profiles               newest first
+    GET /api/admin/profiles/<name>        download (?format=text renders .pstats)
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from flask import Response, g, jsonify, request, send_file
+
+from admin import require_admin
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/tmp/profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "200"))
+PROFILE_SAMPLER = os.environ.get("PROFILE_SAMPLER", "false").lower() == "true"
+PROFILE_SAMPLER_INTERVAL = float(os.environ.get("PROFILE_SAMPLER_INTERVAL", "0.01"))
+PROFILE_SAMPLER_FLUSH_SEC = float(os.environ.get("PROFILE_SAMPLER_FLUSH_SEC", "60"))
+
+NAME_RE = re.compile(r"^[\w.-]+\.(pstats|folded)$")
+
+_profile_lock = threading.Lock()
+_active = {}  # thread id -> route of the request it is serving
+_samples = Counter()  # (route, collapsed stack) -> count
+_samples_lock = threading.Lock()
+_sampler = None
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _slug(route: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+def _filename(route: str, ext: str) -> str:
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    return f"{stamp}-{_slug(route)}-{os.getpid()}-{time.time_ns() % 1_000_000:06d}.{ext}"
+
+
+def _prune():
+    files = sorted(PROFILE_DIR.glob("*.*"), key=lambda p: p.stat().st_mtime)
+    for path in files[:-PROFILE_KEEP]:
+        path.unlink(missing_ok=True)
+
+
+def _wants_profile() -> bool:
+    if request.headers.get("X-Profile") == "1" and require_admin() is None:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+# --- Statistical sampler ---
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def _flush_samples():
+    with _samples_lock:
+        samples = dict(_samples)
+        _samples.clear()
+    by_route = {}
+    for (route, stack), count in samples.items():
+        by_route.setdefault(route, []).append(f"{stack} {count}")
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    for route, lines in by_route.items():
+        (PROFILE_DIR / _filename(route, "folded")).write_text("\n".join(lines) + "\n")
+    if by_route:
+        _prune()
+
+
+def _sample_loop():
+    next_flush = time.monotonic() + PROFILE_SAMPLER_FLUSH_SEC
+    while True:
+        time.sleep(PROFILE_SAMPLER_INTERVAL)
+        if _active:
+            frames = sys._current_frames()
+            with _samples_lock:
+                for ident, route in list(_active.items()):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        _samples[(route, _collapse(frame))] += 1
+        if time.monotonic() >= next_flush:
+            next_flush = time.monotonic() + PROFILE_SAMPLER_FLUSH_SEC
+            try:
+                _flush_samples()
+            except Exception:
+                pass
+
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None or not _sampler.is_alive():
+        with _samples_lock:
+            if _sampler is None or not _sampler.is_alive():
+                _sampler = threading.Thread(target=_sample_loop, name="profile-sampler", daemon=True)
+                _sampler.start()
+
+
+# --- Flask wiring ---
+
+def init_app(app):
+    """Install the profiling hooks and the admin endpoints"""
+
+    @app.before_request
+    def _profile_start():
+        if PROFILE_SAMPLER:
+            _ensure_sampler()
+            _active[threading.get_ident()] = _route()
+        if _wants_profile() and _profile_lock.acquire(blocking=False):
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    @app.after_request
+    def _profile_save(response):
+        profiler = g.pop("_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            try:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                name = _filename(_route(), "pstats")
+                profiler.dump_stats(PROFILE_DIR / name)
+                _prune()
+                response.headers["X-Profile-Id"] = name
+            except Exception:
+                pass
+        return response
+
+    @app.teardown_request
+    def _profile_cleanup(exc):
+        _active.pop(threading.get_ident(), None)
+        profiler = g.pop("_profiler", None)
+        if profiler is not None:  # after_request did not run
+            profiler.disable()
+            _profile_lock.release()
+
+    def list_profiles():
+        err = require_admin()
+        if err:
+            return err
+        files = sorted(PROFILE_DIR.glob("*.*"), key=lambda p: p.stat().st_mtime, reverse=True) \
+            if PROFILE_DIR.is_dir() else []
+        return jsonify({
+            "ok": True,
+            "profiles": [
+                {
+                    "name": p.name,
+                    "kind": "cprofile" if p.suffix == ".pstats" else "sampled",
+                    "size": p.stat().st_size,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(p.stat().st_mtime)),
+                }
+                for p in files if NAME_RE.match(p.name)
+            ]
+        })
+
+    def get_profile(name):
+        err = require_admin()
+        if err:
+            return err
+        path = PROFILE_DIR / name
+        if not NAME_RE.match(name) or not path.is_file():
+            return jsonify({"ok": False, "error": "profile not found"}), 404
+        if request.args.get("format") == "text" and path.suffix == ".pstats":
+            out = io.StringIO()
+            stats = pstats.Stats(str(path), stream=out)
+            sort = request.args.get("sort", "cumulative")
+            stats.sort_stats(sort if sort in ("cumulative", "tottime", "ncalls") else "cumulative")
+            stats.print_stats(request.args.get("limit", 60, type=int))
+            return Response(out.getvalue(), mimetype="text/plain")
+        return send_file(path, as_attachment=True, download_name=name)
+
+    app.add_url_rule("/api/admin/profiles", "list_profiles", list_profiles)
+    app.add_url_rule("/api/admin/profiles/<name>", "get_profile", get_profile)
@@ -0,0 +1,133 @@
+"""
+Per-request Postgres accounting for the events API.
+
+Every statement run through metrics.TimedCursor is counted against the
+current request (count, total time, rows). After the request:
+
+- a Server-Timing header reports it: db;dur=12.3;desc="7 queries, 42 rows"
+- statements slower than SLOW_QUERY_MS are logged; a SLOW_QUERY_EXPLAIN_RATE
+  sample of slow read-only ones is re-run under EXPLAIN (ANALYZE, BUFFERS)
+  and the plan is logged with them
+- requests issuing more than their query budget (QUERY_BUDGET, or a
+  per-route value from QUERY_BUDGET_ROUTES="/api/authz=2,/api/tou=1") are
+  logged with their most repeated statements, which is where N+1 loops show
+"""
+import json
+import logging
+import os
+import random
+import re
+from collections import Counter
+
+import psycopg
+from flask import g, has_request_context, request
+from prometheus_client import Counter as PromCounter, Histogram
+
+import metrics
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", "10"))
+QUERY_BUDGET_ROUTES = {
+    route.strip(): int(budget)
+    for route, _, budget in (
+        item.partition("=") for item in os.environ.get("QUERY_BUDGET_ROUTES", "").split(",") if "=" in item
+    )
+}
+
+QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Postgres statements per HTTP request",
+    ["blueprint", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+BUDGET_EXCEEDED = PromCounter(
+    "db_query_budget_exceeded_total", "Requests that issued more statements than their budget",
+    ["blueprint", "route"],
+)
+
+log = logging.getLogger("querystats")
+_WRITES = re.compile(r"\b(insert|update|delete|merge|truncate|copy|create|alter|drop)\b", re.I)
+
+
+def _text(query) -> str | None:
+    if isinstance(query, bytes):
+        return query.decode(errors="replace")
+    return query if isinstance(query, str) else None
+
+
+def _explain(cursor, query, params) -> str | None:
+    """EXPLAIN (ANALYZE, BUFFERS) for read-only statements; ANALYZE re-runs the query"""
+    text = _text(query)
+    if text is None or not re.match(r"\s*(select|with)\b", text, re.I) or _WRITES.search(text):
+        return None
+    try:
+        # Savepoint, so a failing EXPLAIN cannot abort the handler's transaction
+        with cursor.connection.transaction():
+            with psycopg.Cursor(cursor.connection) as cur:  # plain cursor: not counted
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + text, params)
+                return "\n".join(row[0] for row in cur.fetchall())
+    except Exception as e:
+        return f"explain failed: {e}"
+
+
+def _on_query(cursor, query, params, seconds, failed):
+    stats = g.get("_querystats") if has_request_context() else None
+    if stats is not None:
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        if not failed and cursor.rowcount > 0:
+            stats["rows"] += cursor.rowcount
+        text = _text(query)
+        stats["statements"][" ".join((text or "<composed>").split())[:160]] += 1
+
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        text = _text(query)
+        entry = {
+            "event": "slow_query",
+            "ms": round(seconds * 1000, 1),
+            "route": request.path if has_request_context() else None,
+            "query": " ".join((text or "<composed>").split())[:2000],
+        }
+        if not failed and random.random() < SLOW_QUERY_EXPLAIN_RATE:
+            entry["plan"] = _explain(cursor, query, params)
+        log.warning(json.dumps(entry))
+
+
+def _budget(route: str) -> int:
+    return QUERY_BUDGET_ROUTES.get(route, QUERY_BUDGET)
+
+
+def init_app(app):
+    """Account statements per request and report them"""
+    metrics.query_listeners.append(_on_query)
+
+    @app.before_request
+    def _querystats_start():
+        g._querystats = {"count": 0, "seconds": 0.0, "rows": 0, "statements": Counter()}
+
+    @app.after_request
+    def _querystats_report(response):
+        stats = g.pop("_querystats", None)
+        if stats is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        blueprint = request.blueprint or "app"
+        if request.endpoint != "metrics":
+            QUERIES_PER_REQUEST.labels(blueprint, route).observe(stats["count"])
+        if stats["count"]:
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={stats["seconds"] * 1000:.1f};desc="{stats["count"]} queries, {stats["rows"]} rows"',
+            )
+        if stats["count"] > _budget(route):
+            BUDGET_EXCEEDED.labels(blueprint, route).inc()
+            log.warning(json.dumps({
+                "event": "query_budget_exceeded",
+                "route": route,
+                "method": request.method,
+                "queries": stats["count"],
+                "budget": _budget(route),
+                "db_ms": round(stats["seconds"] * 1000, 1),
+                "top_statements": stats["statements"].most_common(3),
+            }))
+        return response
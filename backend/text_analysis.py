@@ -0,0 +1,151 @@
+"""
+Vectorized text analysis helpers (tokenizing, TF-IDF, cosine top-k).
+
+Everything works on scipy.sparse CSR matrices so the cost grows with the
+number of non-zero terms rather than documents x vocabulary.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+TOKEN_RE = re.compile(r"[a-z][a-z'’-]*[a-z]")
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its itself
+just me more most my myself no nor not now of off on once only or other our ours ourselves out
+over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves also one may might must
+shall upon us
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens with stop words removed"""
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOP_WORDS]
+
+
+def iter_tokens(stream, chunk_size: int = 1 << 16):
+    """
+    Tokenize a text stream chunk by chunk, so arbitrarily large files are
+    never held in memory. A word cut by a chunk boundary is carried over.
+    """
+    carry = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        text = (carry + chunk).lower()
+        cut = len(text)
+        while cut and (text[cut - 1].isalpha() or text[cut - 1] in "'’-"):
+            cut -= 1
+        carry = text[cut:]
+        for token in TOKEN_RE.findall(text, 0, cut):
+            if token not in STOP_WORDS:
+                yield token
+    for token in TOKEN_RE.findall(carry):
+        if token not in STOP_WORDS:
+            yield token
+
+
+def term_counts(docs_tokens, vocabulary=None):
+    """
+    Build a sparse document-term count matrix.
+    When vocabulary is None it is built from the documents; otherwise
+    unknown terms are dropped.
+    """
+    grow = vocabulary is None
+    vocabulary = {} if grow else vocabulary
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in docs_tokens:
+        counts = Counter(tokens)
+        for term, count in counts.items():
+            col = vocabulary.get(term)
+            if col is None:
+                if not grow:
+                    continue
+                col = vocabulary[term] = len(vocabulary)
+            indices.append(col)
+            data.append(count)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulary)),
+    )
+    matrix.sum_duplicates()
+    return matrix, vocabulary
+
+
+def tfidf(counts):
+    """Sublinear TF x smoothed IDF with L2-normalized rows"""
+    counts = counts.tocsr(copy=True)
+    n_docs = counts.shape[0]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+    counts.data = 1.0 + np.log(counts.data)
+    weighted = counts @ sparse.diags(idf)
+    return normalize_rows(weighted.tocsr())
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def top_k_cosine(matrix, k, rows=None, batch_size=256):
+    """
+    For each requested row of an L2-normalized matrix, return the indices
+    and cosine scores of its k most similar other rows (best first).
+    Similarities are computed a batch of rows at a time as one sparse
+    product, so memory stays at batch_size x n_docs.
+    """
+    n_docs = matrix.shape[0]
+    rows = np.arange(n_docs) if rows is None else np.asarray(rows)
+    k = min(k, max(n_docs - 1, 0))
+    results = {}
+    if k == 0:
+        return {int(r): (np.empty(0, dtype=np.int64), np.empty(0)) for r in rows}
+
+    matrix_t = matrix.T.tocsc()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        sims = (matrix[batch] @ matrix_t).toarray()
+        sims[np.arange(len(batch)), batch] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for i, row in enumerate(batch):
+            results[int(row)] = (top[i], top_scores[i])
+    return results
+
+
+def cosine_matrix(matrix):
+    """Dense pairwise cosine similarity of an L2-normalized sparse matrix"""
+    return (matrix @ matrix.T).toarray()
+
+
+def nmf(matrix, n_topics, iterations=200, seed=0, eps=1e-10):
+    """
+    Non-negative matrix factorization X ~ W @ H with multiplicative updates.
+    Returns W (documents x topics) and H (topics x terms). X stays sparse;
+    only the thin factors are dense.
+    """
+    rng = np.random.default_rng(seed)
+    n_docs, n_terms = matrix.shape
+    scale = np.sqrt(matrix.mean() / max(n_topics, 1)) or 1.0
+    W = rng.random((n_docs, n_topics)) * scale
+    H = rng.random((n_topics, n_terms)) * scale
+    matrix_t = matrix.T.tocsr()
+    for _ in range(iterations):
+        H *= np.asarray(matrix_t @ W).T / (W.T @ W @ H + eps)
+        W *= np.asarray(matrix @ H.T) / (W @ (H @ H.T) + eps)
+    return W, H
@@ -2,19 +2,19 @@
 Terms of Use API endpoints for managing TOU content.
 """
 import os
+import json
 from datetime import datetime, timezone
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 import psycopg
-
-DB_URL = os.environ.get("DB_URL")
+import tou_cache
+from admin import require_admin
+from db import connection
 
 tou_bp = Blueprint('tou', __name__, url_prefix='/api/tou')
 
 
 def _conn():
-    if not DB_URL:
-        raise RuntimeError("DB_URL not configured")
-    return psycopg.connect(DB_URL)
+    return connection()
 
 
 def cors(resp):
@@ -40,38 +40,95 @@ def cors(resp):
         return resp
 
 
+def _load_active_version():
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM tou_content WHERE is_active = true LIMIT 1")
+            row = cur.fetchone()
+            return row[0] if row else None
+
+
+def _load_versions():
+    with _conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM tou_content")
+            return [row[0] for row in cur.fetchall()]
+
+
+def _body_loader(kind, version):
+    """Build the serialized response body for GET /api/tou ("active") or /version/<v> ("version")"""
+    def load():
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT version, content, is_active, created_at, updated_at, created_by
+                    FROM tou_content
+                    WHERE version = %s
+                """, (version,))
+                row = cur.fetchone()
+        if not row:
+            return None
+        data = {
+            "version": row[0],
+            "content": row[1],
+            "created_at": row[3].isoformat() if row[3] else None,
+            "updated_at": row[4].isoformat() if row[4] else None
+        }
+        if kind == "version":
+            data["is_active"] = row[2]
+            data["created_by"] = row[5]
+        return json.dumps({"ok": True, "data": data}, separators=(",", ":")).encode()
+    return load
+
+
+def _acceptance_loader(version):
+    def load():
+        with _conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT LOWER(email) FROM tou_acceptances WHERE tou_version = %s", (version,))
+                for row in cur:
+                    yield row[0]
+    return load
+
+
+def has_accepted_active(email):
+    """
+    True if email has accepted the active TOU version (or none is active).
+    Served from tou_cache without a Postgres query once warm; used by
+    /api/tou/status and the TOU_ENFORCE check in /api/authz.
+    """
+    version = tou_cache.active_version(_load_active_version)
+    if version is None:
+        return True
+    return tou_cache.has_accepted(email, version, _acceptance_loader(version))
+
+
+def _warm_active():
+    try:
+        version = tou_cache.active_version(_load_active_version)
+        if version is not None:
+            tou_cache.warm_acceptances(version, _acceptance_loader(version))
+    except Exception:
+        pass
+
+
 @tou_bp.route('', methods=['GET'])
 def get_active_tou():
     """
     GET /api/tou
-    Returns the active Terms of Use content.
+    Returns the active Terms of Use content (served from tou_cache).
     """
     try:
-        with _conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT version, content, created_at, updated_at
-                    FROM tou_content
-                    WHERE is_active = true
-                    LIMIT 1
-                """)
-                row = cur.fetchone()
-                
-                if not row:
-                    return cors((jsonify({
-                        "ok": False,
-                        "error": "No active TOU found"
-                    }), 404))
-                
-                return cors(jsonify({
-                    "ok": True,
-                    "data": {
-                        "version": row[0],
-                        "content": row[1],
-                        "created_at": row[2].isoformat() if row[2] else None,
-                        "updated_at": row[3].isoformat() if row[3] else None
-                    }
-                }))
+        version = tou_cache.active_version(_load_active_version)
+        body = tou_cache.body("active", version, _body_loader("active", version)) if version else None
+        
+        if not body:
+            return cors((jsonify({
+                "ok": False,
+                "error": "No active TOU found"
+            }), 404))
+        
+        return cors(Response(body, mimetype="application/json"))
     except Exception as e:
         return cors((jsonify({
             "ok": False,
@@ -83,35 +140,18 @@ def get_active_tou():
 def get_tou_version(version):
     """
     GET /api/tou/version/<version>
-    Returns a specific version of the Terms of Use.
+    Returns a specific version of the Terms of Use (served from tou_cache).
     """
     try:
-        with _conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT version, content, is_active, created_at, updated_at, created_by
-                    FROM tou_content
-                    WHERE version = %s
-                """, (version,))
-                row = cur.fetchone()
-                
-                if not row:
-                    return cors((jsonify({
-                        "ok": False,
-                        "error": f"Version {version} not found"
-                    }), 404))
-                
-                return cors(jsonify({
-                    "ok": True,
-                    "data": {
-                        "version": row[0],
-                        "content": row[1],
-                        "is_active": row[2],
-                        "created_at": row[3].isoformat() if row[3] else None,
-                        "updated_at": row[4].isoformat() if row[4] else None,
-                        "created_by": row[5]
-                    }
-                }))
+        body = tou_cache.body("version", version, _body_loader("version", version))
+        
+        if not body:
+            return cors((jsonify({
+                "ok": False,
+                "error": f"Version {version} not found"
+            }), 404))
+        
+        return cors(Response(body, mimetype="application/json"))
     except Exception as e:
         return cors((jsonify({
             "ok": False,
@@ -188,6 +228,11 @@ def create_tou():
                 result = cur.fetchone()
                 conn.commit()
                 
+                # New version: refresh the cached version set (and active pointer)
+                tou_cache.invalidate_all()
+                if set_active:
+                    _warm_active()
+                
                 return cors(jsonify({
                     "ok": True,
                     "data": {
@@ -284,6 +329,12 @@ def update_tou(version):
                 result = cur.fetchone()
                 conn.commit()
                 
+                if set_active is not None:
+                    tou_cache.invalidate_all()
+                    _warm_active()
+                else:
+                    tou_cache.invalidate(version)
+                
                 return cors(jsonify({
                     "ok": True,
                     "data": {
@@ -306,16 +357,22 @@ def accept_tou():
     POST /api/tou/accept
     Records user's acceptance of the Terms of Use.
     
+    The version is validated against the cached version set and the
+    acceptance is queued for tou_writer.py to insert in batches (202).
+    Pass "sync": true to write it immediately and get the row id back.
+    
     Request body:
     {
         "email": "user@example.com",
-        "version": 1
+        "version": 1,
+        "sync": false  // Optional
     }
     """
     try:
         data = request.get_json(force=True)
         email = (data.get("email") or "").strip().lower()
         version = data.get("version")
+        sync = bool(data.get("sync", False))
         
         if not email or not version:
             return cors((jsonify({
@@ -323,29 +380,57 @@ def accept_tou():
                 "error": "email and version are required"
             }), 400))
         
+        try:
+            version = int(version)
+        except (TypeError, ValueError):
+            return cors((jsonify({
+                "ok": False,
+                "error": "version must be an integer"
+            }), 400))
+        
+        # Verify version exists
+        if version not in tou_cache.known_versions(_load_versions):
+            return cors((jsonify({
+                "ok": False,
+                "error": f"Version {version} does not exist"
+            }), 404))
+        
         # Get user's IP and user agent
         ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
         user_agent = request.headers.get('User-Agent', '')
+        accepted_at = datetime.now(timezone.utc)
+        
+        if not sync:
+            tou_cache.enqueue_acceptance({
+                "email": email,
+                "version": version,
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+                "accepted_at": accepted_at.isoformat()
+            })
+            tou_cache.mark_accepted(email, version)
+            return cors((jsonify({
+                "ok": True,
+                "data": {
+                    "queued": True,
+                    "accepted_at": accepted_at.isoformat()
+                }
+            }), 202))
         
         with _conn() as conn:
             with conn.cursor() as cur:
-                # Verify version exists
-                cur.execute("SELECT version FROM tou_content WHERE version = %s", (version,))
-                if not cur.fetchone():
-                    return cors((jsonify({
-                        "ok": False,
-                        "error": f"Version {version} does not exist"
-                    }), 404))
-                
-                # Record acceptance
+                # Record acceptance (repeat accepts keep the first row)
                 cur.execute("""
-                    INSERT INTO tou_acceptances (email, tou_version, ip_address, user_agent)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO tou_acceptances (email, tou_version, ip_address, user_agent, accepted_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT ((LOWER(email)), tou_version)
+                    DO UPDATE SET accepted_at = tou_acceptances.accepted_at
                     RETURNING id, accepted_at
-                """, (email, version, ip_address, user_agent))
+                """, (email, version, ip_address, user_agent, accepted_at))
                 
                 result = cur.fetchone()
                 conn.commit()
+                tou_cache.mark_accepted(email, version)
                 
                 return cors(jsonify({
                     "ok": True,
@@ -362,6 +447,47 @@ def accept_tou():
         }), 500))
 
 
+@tou_bp.route('/status', methods=['GET'])
+def get_tou_status():
+    """
+    GET /api/tou/status
+    Returns whether the signed-in user (session cookie) has accepted the
+    active TOU version. Admins (X-Admin-Key) may ask about any user with
+    ?email=; without the key that would tell anyone which emails exist.
+    """
+    if request.args.get("email"):
+        err = require_admin()
+        if err:
+            return cors(err)
+        email = request.args["email"].strip().lower()
+    else:
+        from app import verify_session
+        token = request.cookies.get("session")
+        valid, email = verify_session(token, None) if token else (False, None)
+        if not valid or not email:
+            return cors((jsonify({
+                "ok": False,
+                "error": "sign in, or pass ?email= with the admin key"
+            }), 401))
+        email = email.strip().lower()
+    
+    try:
+        version = tou_cache.active_version(_load_active_version)
+        return cors(jsonify({
+            "ok": True,
+            "data": {
+                "email": email,
+                "version": version,
+                "accepted": has_accepted_active(email)
+            }
+        }))
+    except Exception as e:
+        return cors((jsonify({
+            "ok": False,
+            "error": str(e)
+        }), 500))
+
+
 @tou_bp.route('/history', methods=['GET'])
 def get_tou_history():
     """
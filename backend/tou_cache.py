@@ -0,0 +1,203 @@
+"""
+Cache for Terms of Use response bodies.
+
+The active version changes perhaps once a year, so GET /api/tou should not
+touch Postgres. Response bodies are pre-serialized JSON, keyed by version:
+
+    in-process dict  ->  Redis (tou:body:<kind>:<version>, tou:active)  ->  loader (DB)
+
+Writes call invalidate()/invalidate_all() after commit, which clear Redis and
+publish on TOU_CHANNEL; every worker runs a subscriber thread that drops its
+local entries. Local entries also expire after LOCAL_TTL seconds as a safety
+net in case a pub/sub message is missed.
+"""
+import json
+import os
+import threading
+import time
+
+from metrics import TimedRedis, cache_result
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+TOU_CHANNEL = "tou:invalidate"
+ACTIVE_KEY = "tou:active"
+VERSIONS_KEY = "tou:versions"
+BODY_KEY = "tou:body:{kind}:{version}"
+REDIS_TTL = int(os.environ.get("TOU_CACHE_TTL", "86400"))
+LOCAL_TTL = int(os.environ.get("TOU_LOCAL_CACHE_TTL", "300"))
+
+r = TimedRedis.from_url(REDIS_URL)
+
+_lock = threading.Lock()
+_local = {}  # key -> (expires_at, value)
+_listener = None
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TOU_CHANNEL)
+            # Anything cached before (re)subscribing may have missed a message
+            _clear_local(None)
+            for message in pubsub.listen():
+                data = message.get("data")
+                _clear_local(None if data in (b"*", "*") else int(data))
+        except Exception:
+            time.sleep(1)
+
+
+def _ensure_listener():
+    global _listener
+    if _listener is None or not _listener.is_alive():
+        with _lock:
+            if _listener is None or not _listener.is_alive():
+                _listener = threading.Thread(target=_listen, name="tou-cache-invalidator", daemon=True)
+                _listener.start()
+
+
+def _clear_local(version):
+    with _lock:
+        if version is None:
+            _local.clear()
+        else:
+            for key in [k for k in _local if k.endswith(f":{version}")]:
+                del _local[key]
+
+
+def _local_get(key):
+    entry = _local.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _local_set(key, value):
+    with _lock:
+        _local[key] = (time.monotonic() + LOCAL_TTL, value)
+
+
+def _get(key, load):
+    """Read-through lookup for one key: local, then Redis, then load()"""
+    value = _local_get(key)
+    if value is not None:
+        cache_result("tou", "local")
+        return value
+    try:
+        value = r.get(key)
+    except Exception:
+        value = None
+    cache_result("tou", "redis" if value is not None else "miss")
+    if value is None:
+        value = load()
+        if value is None:
+            return None
+        try:
+            r.setex(key, REDIS_TTL, value)
+        except Exception:
+            pass
+    _local_set(key, value)
+    return value
+
+
+def active_version(load_version):
+    """Active TOU version number; load_version() queries the DB on a miss"""
+    _ensure_listener()
+
+    def load():
+        version = load_version()
+        return None if version is None else str(version).encode()
+
+    value = _get(ACTIVE_KEY, load)
+    return int(value) if value is not None else None
+
+
+def known_versions(load_versions) -> set:
+    """Every existing version number; load_versions() queries the DB on a miss"""
+    _ensure_listener()
+    value = _get(VERSIONS_KEY, lambda: ",".join(str(v) for v in load_versions()).encode())
+    return {int(v) for v in value.decode().split(",") if v}
+
+
+def body(kind: str, version: int, load_body):
+    """Pre-serialized JSON body for a version; load_body() returns bytes or None"""
+    _ensure_listener()
+    return _get(BODY_KEY.format(kind=kind, version=version), load_body)
+
+
+def invalidate(version: int):
+    """Drop cached bodies for one version (content edits)"""
+    try:
+        r.delete(*[BODY_KEY.format(kind=k, version=version) for k in ("active", "version")])
+        r.publish(TOU_CHANNEL, str(version))
+    except Exception:
+        pass
+    _clear_local(version)
+
+
+def invalidate_all():
+    """Drop everything (new versions, activation changes)"""
+    try:
+        keys = list(r.scan_iter("tou:body:*")) + [ACTIVE_KEY, VERSIONS_KEY]
+        r.delete(*keys)
+        r.publish(TOU_CHANNEL, "*")
+    except Exception:
+        pass
+    _clear_local(None)
+
+
+# --- Acceptance sets ---
+# tou:accepted:<version> holds every (lowercased) email that accepted that
+# version; tou:accepted:<version>:warm marks the set as complete, so a miss
+# can be answered "not accepted" without asking Postgres. The marker expires
+# after ACCEPTED_WARM_TTL, so acceptances written outside the API (imports,
+# manual SQL) show up at the next re-warm instead of never.
+ACCEPTED_KEY = "tou:accepted:{version}"
+WARM_KEY = "tou:accepted:{version}:warm"
+ACCEPTED_WARM_TTL = int(os.environ.get("TOU_ACCEPTED_WARM_TTL", "3600"))
+
+
+def mark_accepted(email: str, version: int):
+    try:
+        r.sadd(ACCEPTED_KEY.format(version=version), email.lower())
+    except Exception:
+        pass
+
+
+def warm_acceptances(version: int, load_emails):
+    """Load every accepted email for a version into Redis; load_emails() yields emails"""
+    key = ACCEPTED_KEY.format(version=version)
+    pipe = r.pipeline(transaction=False)
+    batch = []
+    for email in load_emails():
+        batch.append(email.lower())
+        if len(batch) >= 1000:
+            pipe.sadd(key, *batch)
+            batch = []
+    if batch:
+        pipe.sadd(key, *batch)
+    pipe.set(WARM_KEY.format(version=version), 1, ex=ACCEPTED_WARM_TTL)
+    pipe.execute()
+
+
+def has_accepted(email: str, version: int, load_emails) -> bool:
+    """One Redis round trip once the version's set is warm"""
+    pipe = r.pipeline(transaction=False)
+    pipe.sismember(ACCEPTED_KEY.format(version=version), email.lower())
+    pipe.exists(WARM_KEY.format(version=version))
+    accepted, warm = pipe.execute()
+    cache_result("tou_acceptance", "hit" if accepted or warm else "miss")
+    if accepted or warm:
+        return bool(accepted)
+    warm_acceptances(version, load_emails)
+    return bool(r.sismember(ACCEPTED_KEY.format(version=version), email.lower()))
+
+
+# --- Acceptance ingestion queue (drained by tou_writer.py) ---
+ACCEPT_QUEUE = "tou:accept:queue"
+# Items the writer could not insert, with the error, for inspection and replay
+ACCEPT_DEAD_LETTER = "tou:accept:dead"
+
+
+def enqueue_acceptance(record: dict):
+    r.rpush(ACCEPT_QUEUE, json.dumps(record))
@@ -0,0 +1,159 @@
+"""
+Background writer for queued TOU acceptances.
+
+POST /api/tou/accept pushes acceptances onto the Redis list tou:accept:queue.
+This process drains it in batches: dedupe by (email, version), one multi-row
+INSERT ... ON CONFLICT DO NOTHING per batch, then trim what was written.
+
+Items are read with LRANGE and only removed (LTRIM) after the commit, so a
+crash re-delivers the batch and the unique index makes the retry a no-op.
+If the batch INSERT fails it is retried row by row; unparseable items and
+rows that still fail are moved to tou:accept:dead so one bad record cannot
+block the queue. Lost connections are not a bad record: the batch is left
+queued and retried. Run exactly one writer per queue:
+
+    DB_URL=postgresql://... python tou_writer.py
+"""
+import json
+import os
+import signal
+import time
+from datetime import datetime, timezone
+
+import psycopg
+import redis
+
+from tou_cache import ACCEPT_DEAD_LETTER, ACCEPT_QUEUE
+
+DB_URL = os.environ.get("DB_URL")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+BATCH_SIZE = int(os.environ.get("TOU_WRITER_BATCH", "500"))
+IDLE_SLEEP = float(os.environ.get("TOU_WRITER_IDLE_SEC", "0.5"))
+
+r = redis.from_url(REDIS_URL)
+
+_running = True
+
+
+def _stop(signum, frame):
+    global _running
+    _running = False
+
+
+def _conn():
+    if not DB_URL:
+        raise RuntimeError("DB_URL not configured")
+    return psycopg.connect(DB_URL)
+
+
+def _dead_letter(item, error) -> str:
+    if isinstance(item, bytes):
+        item = item.decode("utf-8", "replace")
+    return json.dumps({
+        "item": item,
+        "error": str(error),
+        "failed_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def _dedupe(items):
+    """
+    Keep the earliest acceptance per (email, version).
+    Returns (records, dead letters for items that could not be parsed).
+    """
+    first = {}
+    dead = []
+    for raw in items:
+        try:
+            rec = json.loads(raw)
+            key = (rec["email"].lower(), int(rec["version"]))
+            accepted_at = str(rec["accepted_at"])
+        except Exception as e:
+            dead.append(_dead_letter(raw, e))
+            continue
+        if key not in first or accepted_at < str(first[key]["accepted_at"]):
+            first[key] = rec
+    return list(first.values()), dead
+
+
+def write_batch(conn, records) -> int:
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO tou_acceptances (email, tou_version, ip_address, user_agent, accepted_at)
+            SELECT * FROM unnest(%s::text[], %s::int[], %s::text[], %s::text[], %s::timestamptz[])
+            ON CONFLICT ((LOWER(email)), tou_version) DO NOTHING
+        """, (
+            [rec["email"] for rec in records],
+            [int(rec["version"]) for rec in records],
+            [rec.get("ip_address") for rec in records],
+            [rec.get("user_agent") for rec in records],
+            [rec["accepted_at"] for rec in records],
+        ))
+        inserted = cur.rowcount
+    conn.commit()
+    return inserted
+
+
+def write_rows(conn, records) -> list:
+    """Insert one record at a time; returns dead letters for the ones that fail"""
+    dead = []
+    for rec in records:
+        try:
+            write_batch(conn, [rec])
+        except psycopg.OperationalError:
+            raise
+        except Exception as e:
+            conn.rollback()
+            print(f"tou_writer: dead-lettering {rec.get('email')!r} v{rec.get('version')}: {e}", flush=True)
+            dead.append(_dead_letter(json.dumps(rec), e))
+    return dead
+
+
+def flush_once(conn) -> int:
+    """Write up to BATCH_SIZE queued acceptances; returns how many were read"""
+    items = r.lrange(ACCEPT_QUEUE, 0, BATCH_SIZE - 1)
+    if not items:
+        return 0
+    records, dead = _dedupe(items)
+    if records:
+        try:
+            write_batch(conn, records)
+        except psycopg.OperationalError:
+            # Connection trouble, not a bad row: leave the batch queued
+            raise
+        except Exception as e:
+            conn.rollback()
+            print(f"tou_writer: batch of {len(records)} failed ({e}), retrying row by row", flush=True)
+            dead += write_rows(conn, records)
+    pipe = r.pipeline()
+    if dead:
+        pipe.rpush(ACCEPT_DEAD_LETTER, *dead)
+    pipe.ltrim(ACCEPT_QUEUE, len(items), -1)
+    pipe.execute()
+    return len(items)
+
+
+def run():
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    conn = None
+    while _running:
+        try:
+            if conn is None or conn.closed:
+                conn = _conn()
+            if flush_once(conn) < BATCH_SIZE:
+                time.sleep(IDLE_SLEEP)
+        except Exception as e:
+            print(f"tou_writer: {e}", flush=True)
+            if conn is not None:
+                conn.close()
+            conn = None
+            time.sleep(2)
+    # Drain what is left before exiting
+    if conn is not None and not conn.closed:
+        while flush_once(conn):
+            pass
+
+
+if __name__ == "__main__":
+    run()
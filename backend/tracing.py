@@ -0,0 +1,397 @@
+"""
+Trace propagation for the events API, its RQ jobs and Mailgun.
+
+W3C trace context (the traceparent header format) ties together the hops of
+one email, so its latency can be split by stage:
+
+    HTTP request (server span; an incoming traceparent header is honoured)
+      -> Postgres statements and Redis commands (client spans)
+      -> q.enqueue (producer span; payload["traceparent"] carries the context)
+      -> RQ job in worker.py (consumer span)
+      -> send_mailgun (client span; traceparent and send time go to Mailgun
+         as v: variables and come back in its webhooks)
+      -> Mailgun delivered/failed webhook (mailgun.<event> span, send -> event)
+
+The trace id is also written to email_logs.metadata.trace_id.
+
+Spans are exported when the outermost span of a process ends, to:
+- TRACE_FILE: one JSON object per span per line
+- OTEL_EXPORTER_OTLP_ENDPOINT: OTLP/HTTP JSON posted to <endpoint>/v1/traces,
+  from a background thread in the API and inline in RQ jobs (the work
+  horse exits as soon as the job returns)
+
+Nothing is recorded unless one of them is set. TRACE_SAMPLE_RATE (default 1)
+samples new traces; an incoming traceparent keeps its own sampled flag.
+
+    python tracing.py report /var/log/events/traces.jsonl
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import requests
+
+import metrics
+
+TRACE_FILE = os.environ.get("TRACE_FILE")
+OTLP_ENDPOINT = (os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT") or "").rstrip("/")
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "events-api")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1"))
+ENABLED = bool(TRACE_FILE or OTLP_ENDPOINT)
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+_current = ContextVar("trace_span", default=None)
+_file_lock = threading.Lock()
+_otlp_queue = queue.Queue(maxsize=1000)
+_otlp_thread = None
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+                 "start_ns", "end_ns", "attributes", "error", "segment")
+
+    def __init__(self, name, kind, trace_id, parent_id, sampled, segment, start_ns=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.error = None
+        self.segment = segment  # finished spans of this process's part of the trace
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, error):
+        self.error = str(error)[:500]
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class _NoopSpan:
+    trace_id = traceparent = None
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def parse_traceparent(value):
+    """(trace_id, parent span id, sampled) or None"""
+    m = TRACEPARENT_RE.match((value or "").strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return m.group(1), m.group(2), bool(int(m.group(3), 16) & 1)
+
+
+def _new_span(name, kind, traceparent=None, start_ns=None):
+    parent = _current.get()
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote:
+        trace_id, parent_id, sampled = remote
+        return Span(name, kind, trace_id, parent_id, sampled, [], start_ns)
+    if parent is not None:
+        return Span(name, kind, parent.trace_id, parent.span_id, parent.sampled, parent.segment, start_ns)
+    sampled = random.random() < TRACE_SAMPLE_RATE
+    return Span(name, kind, os.urandom(16).hex(), None, sampled, [], start_ns)
+
+
+def start_span(name, kind="internal", traceparent=None, **attributes):
+    """Start a span and make it current; pass the returned token to end_span()"""
+    if not ENABLED:
+        return NOOP, None
+    span = _new_span(name, kind, traceparent)
+    span.set(**attributes)
+    return span, _current.set(span)
+
+
+def end_span(span, token):
+    if token is None:
+        return
+    _current.reset(token)
+    span.end_ns = time.time_ns()
+    span.segment.append(span)
+    # Outermost span in this process: ship the whole segment
+    if span.sampled and (_current.get() is None or _current.get().segment is not span.segment):
+        _export(span.segment, background=span.kind == "server")
+
+
+@contextmanager
+def span(name, kind="internal", traceparent=None, **attributes):
+    """
+    Child of the current span, or of traceparent if given (the context an
+    RQ payload or webhook carried), or the root of a new trace.
+    """
+    current, token = start_span(name, kind, traceparent, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        end_span(current, token)
+
+
+def record(name, kind, seconds, failed=False, **attributes):
+    """Add an already finished child span (DB statement, Redis command) to the current span"""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return
+    end = time.time_ns()
+    child = Span(name, kind, parent.trace_id, parent.span_id, True, parent.segment, end - int(seconds * 1e9))
+    child.end_ns = end
+    child.set(**attributes)
+    if failed:
+        child.error = "failed"
+    parent.segment.append(child)
+
+
+def emit(name, traceparent, start, end, kind="internal", **attributes):
+    """Export a span for a stage timed elsewhere (e.g. Mailgun's own timestamps, in epoch seconds)"""
+    remote = parse_traceparent(traceparent)
+    if not ENABLED or not remote or not remote[2]:
+        return
+    s = Span(name, kind, remote[0], remote[1], True, [], int(start * 1e9))
+    s.end_ns = int(end * 1e9)
+    s.set(**attributes)
+    s.segment.append(s)
+    _export(s.segment, background=False)
+
+
+def current():
+    return _current.get() or NOOP
+
+
+def trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def inject(payload: dict) -> dict:
+    """Add the current traceparent to a job or queue payload"""
+    span = _current.get()
+    if span is not None:
+        payload["traceparent"] = span.traceparent
+    return payload
+
+
+def with_trace(metadata: dict | None) -> dict:
+    """email_logs.metadata with the current trace id"""
+    metadata = dict(metadata or {})
+    if trace_id():
+        metadata["trace_id"] = trace_id()
+    return metadata
+
+
+# --- Export ---
+
+def _as_dict(s):
+    return {
+        "trace_id": s.trace_id,
+        "span_id": s.span_id,
+        "parent_id": s.parent_id,
+        "name": s.name,
+        "kind": s.kind,
+        "service": SERVICE_NAME,
+        "start_ns": s.start_ns,
+        "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3),
+        "attributes": s.attributes,
+        "error": s.error,
+    }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_body(spans):
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": KINDS.get(s.kind, 1),
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+def _post_otlp(spans):
+    try:
+        requests.post(f"{OTLP_ENDPOINT}/v1/traces", json=_otlp_body(spans), timeout=(1, 3))
+    except Exception:
+        pass
+
+
+def _otlp_loop():
+    while True:
+        spans = _otlp_queue.get()
+        while len(spans) < 512:
+            try:
+                spans.extend(_otlp_queue.get_nowait())
+            except queue.Empty:
+                break
+        _post_otlp(spans)
+
+
+def _export(spans, background):
+    global _otlp_thread
+    if TRACE_FILE:
+        lines = "".join(json.dumps(_as_dict(s), default=str) + "\n" for s in spans)
+        try:
+            with _file_lock, open(TRACE_FILE, "a") as f:
+                f.write(lines)
+        except Exception:
+            pass
+    if OTLP_ENDPOINT:
+        if not background:
+            _post_otlp(spans)
+            return
+        if _otlp_thread is None or not _otlp_thread.is_alive():
+            _otlp_thread = threading.Thread(target=_otlp_loop, name="otlp-exporter", daemon=True)
+            _otlp_thread.start()
+        try:
+            _otlp_queue.put_nowait(list(spans))
+        except queue.Full:
+            pass  # collector down or slow: drop rather than grow
+
+
+# --- Wiring ---
+
+def _on_query(cursor, query, params, seconds, failed):
+    record(f"db.{metrics._operation(query)}", "client", seconds, failed, **{"db.system": "postgresql"})
+
+
+def _on_redis(command, seconds, failed):
+    record(f"redis.{command}", "client", seconds, failed, **{"db.system": "redis"})
+
+
+def instrument():
+    """Turn TimedCursor statements and TimedRedis commands into child spans"""
+    if ENABLED and _on_query not in metrics.query_listeners:
+        metrics.query_listeners.append(_on_query)
+        metrics.redis_listeners.append(_on_redis)
+
+
+def init_app(app):
+    """One server span per request, continuing the caller's traceparent"""
+    from flask import g, request
+
+    instrument()
+
+    @app.before_request
+    def _trace_start():
+        if request.endpoint == "metrics":
+            return
+        g._trace = start_span(f"{request.method} {request.path}", "server",
+                              request.headers.get("traceparent"), **{"http.method": request.method})
+
+    @app.after_request
+    def _trace_response(response):
+        span, token = g.get("_trace", (NOOP, None))
+        if token is not None:
+            span.name = f"{request.method} {request.url_rule.rule if request.url_rule else 'unmatched'}"
+            span.set(**{"http.status_code": response.status_code})
+            if response.status_code >= 500:
+                span.fail(f"HTTP {response.status_code}")
+            response.headers["traceresponse"] = span.traceparent
+        return response
+
+    @app.teardown_request
+    def _trace_end(exc):
+        span, token = g.pop("_trace", (NOOP, None))
+        if exc is not None:
+            span.fail(exc)
+        end_span(span, token)
+
+
+# --- Report ---
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def report(path):
+    """Per-stage latency from a TRACE_FILE, plus send-to-delivery and request-to-delivery times"""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    by_id = {s["span_id"]: s for s in spans}
+    stages = defaultdict(list)
+    traces = defaultdict(list)
+    for s in spans:
+        stages[s["name"]].append(s["duration_ms"])
+        traces[s["trace_id"]].append(s)
+        parent = by_id.get(s["parent_id"])
+        if s["kind"] == "consumer" and parent and parent["kind"] == "producer":
+            queued = (s["start_ns"] - parent["start_ns"]) / 1e6 - parent["duration_ms"]
+            stages["rq.queue_wait"].append(round(queued, 3))
+
+    end_to_end = []
+    for members in traces.values():
+        delivered = [s for s in members if s["name"] == "mailgun.delivered"]
+        if delivered:
+            first = min(s["start_ns"] for s in members)
+            end_to_end.append((delivered[0]["start_ns"] - first) / 1e6 + delivered[0]["duration_ms"])
+    if end_to_end:
+        stages["request_to_inbox"] = end_to_end
+
+    print(f"{'stage':40} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total ms':>12}")
+    for name, values in sorted(stages.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name[:40]:40} {len(values):>6} {_pct(values, 50):>10.1f} {_pct(values, 95):>10.1f} "
+              f"{max(values):>10.1f} {sum(values):>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rep = sub.add_parser("report", help="Latency per stage from a TRACE_FILE")
+    rep.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report(args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,11 @@ import redis
 from rq import Connection, Worker
 
 from email_mailgun import send_mailgun
+import tracing
 
 REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
 r = redis.from_url(REDIS_URL)
+tracing.instrument()
 
 # Simple in-memory suppressions cache (persist in DB in production)
 SUPPRESSIONS = set()
@@ -15,6 +17,12 @@ SUPPRESSIONS = set()
 
 def handle_event(event: dict):
     """Entry point queued by /api/track."""
+    with tracing.span("rq.job worker.handle_event", "consumer", event.get("traceparent"),
+                      **{"event.type": event.get("type")}):
+        _handle_event(event)
+
+
+def _handle_event(event: dict):
     etype = event.get("type")
     user = event.get("user", {})
     email = user.get("email")
@@ -56,6 +64,15 @@ def handle_mailgun_event(event_data_str: str):
 
     evt = data.get("event")
     recipient = data.get("recipient")
+
+    # Send -> delivered/failed, on the trace of the request that sent it
+    user_vars = data.get("user-variables") or {}
+    try:
+        tracing.emit(f"mailgun.{evt}", user_vars.get("traceparent"), float(user_vars["sent_at"]),
+                     float(data["timestamp"]), template=(data.get("tags") or [None])[0],
+                     reason=data.get("reason"))
+    except (KeyError, TypeError, ValueError):
+        pass
     if evt in {"complained", "bounced"} and recipient:
         SUPPRESSIONS.add(recipient)
 
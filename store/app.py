@@ -1,18 +1,25 @@
 import os
-import uuid
-import json
+import gzip
+import hashlib
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import requests
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify
+import catalog
+import metrics
+import square_client
+
+try:
+    import brotli
+except ImportError:  # optional: serve gzip only
+    brotli = None
 
 app = Flask(__name__)
+metrics.init_app(app)
 
 # Admin API key
 ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY", "change-me-in-production")
 
 # Product metadata file
-PRODUCT_DATA_FILE = Path("/data/product_data.json")
-PRODUCT_DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
+PRODUCT_DATA_FILE = Path(os.environ.get("PRODUCT_DATA_FILE", "/data/product_data.json"))
 
 # Pricing (in cents)
 PRICE_INDIVIDUAL = int(os.environ.get("PRICE_INDIVIDUAL", "1499"))
@@ -23,18 +30,10 @@ PRICE_NONPROFIT_PER_USER = int(os.environ.get("PRICE_NONPROFIT_PER_USER", "999")
 NONPROFIT_MIN_USERS = int(os.environ.get("NONPROFIT_MIN_USERS", "10"))
 CURRENCY = os.environ.get("CURRENCY", "USD")
 
-# Square
-SQUARE_ACCESS_TOKEN = os.environ.get("SQUARE_ACCESS_TOKEN")
-SQUARE_LOCATION_ID  = os.environ.get("SQUARE_LOCATION_ID")
-SQUARE_BASE         = os.environ.get("SQUARE_BASE", "https://connect.squareup.com")
-
 STORE_BASE_URL      = os.environ.get("STORE_BASE_URL", "https://scideology.app")
 
-# Load product data from file or defaults
-def load_product_data():
-    if PRODUCT_DATA_FILE.exists():
-        with open(PRODUCT_DATA_FILE) as f:
-            return json.load(f)
+# Default product data, used until the first admin update writes the file
+def default_product_data():
     return {
         "title": "Parallel Critiques — Analyzing Rhetorical Extremism",
         "description": "Purchase access to the complete text analysis book and interactive notebooks.",
@@ -52,69 +51,85 @@ def load_product_data():
         }
     }
 
-def save_product_data(data):
-    with open(PRODUCT_DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+# Catalog is shared across workers via the file; see catalog.py
+catalog.init(PRODUCT_DATA_FILE, default_product_data)
 
-PRODUCT_DATA = load_product_data()
-TIERS = PRODUCT_DATA["tiers"]
+# Rendered landing page per catalog version: {"version", "etag", "identity", "gzip", "br"}.
+# Every admin write bumps catalog_version, which is what invalidates it.
+_page_cache = {}
+
+def _rendered_page(product_data):
+    page = _page_cache.get("page")
+    metrics.cache_result("page", "hit" if page and page["version"] == product_data["catalog_version"] else "miss")
+    if page is None or page["version"] != product_data["catalog_version"]:
+        html = render_template("product.html", product=product_data, tiers=product_data["tiers"]).encode("utf-8")
+        page = {
+            "version": product_data["catalog_version"],
+            "etag": f'{product_data["catalog_version"]}-{hashlib.sha256(html).hexdigest()[:16]}',
+            "identity": html,
+            "gzip": gzip.compress(html, compresslevel=9),
+            "br": brotli.compress(html, quality=11) if brotli else None,
+        }
+        _page_cache["page"] = page
+    return page
 
 @app.get("/")
 def product():
-    return render_template("product.html", product=PRODUCT_DATA, tiers=TIERS)
+    page = _rendered_page(catalog.get())
+    headers = {
+        "ETag": f'"{page["etag"]}"',
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+    }
+    if request.if_none_match.contains(page["etag"]):
+        return Response(status=304, headers=headers)
+    
+    accepted = request.accept_encodings
+    if page["br"] is not None and accepted["br"]:
+        body, headers["Content-Encoding"] = page["br"], "br"
+    elif accepted["gzip"]:
+        body, headers["Content-Encoding"] = page["gzip"], "gzip"
+    else:
+        body = page["identity"]
+    return Response(body, mimetype="text/html", headers=headers)
 
 @app.post("/checkout")
 def checkout():
     tier_key = (request.form.get("tier") or "individual").lower()
     buyer_email = (request.form.get("email") or "").strip()
-    if tier_key not in TIERS:
+    product_data = catalog.get()
+    tiers = product_data["tiers"]
+    if tier_key not in tiers:
         tier_key = "individual"
-    tier = TIERS[tier_key]
+    tier = tiers[tier_key]
 
-    if not (SQUARE_ACCESS_TOKEN and SQUARE_LOCATION_ID):
+    if not square_client.configured():
         # Dev mode fallback: simulate success
         return redirect(url_for("confirmation", status="simulated", tier=tier_key))
 
-    headers = {
-        "Authorization": f"Bearer {SQUARE_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-        "Square-Version": os.environ.get("SQUARE_VERSION", "2024-09-26"),
-    }
-
-    idempotency_key = str(uuid.uuid4())
-    body = {
-        "idempotency_key": idempotency_key,
-        "order": {
-            "location_id": SQUARE_LOCATION_ID,
-            "line_items": [
-                {
-                    "name": f"{PRODUCT_DATA['title']} — {tier['name']} License",
-                    "quantity": "1",
-                    "base_price_money": {"amount": tier["price"], "currency": CURRENCY},
-                }
-            ],
-        },
-        "checkout_options": {
-            "redirect_url": f"{STORE_BASE_URL}/confirmation",
-            "ask_for_shipping_address": False,
-            "enable_guest_checkout": True,
-        },
-    }
+    # Repeat submits by the same buyer within the link window reuse one link
+    buyer = square_client.buyer_fingerprint(buyer_email, request.remote_addr, request.headers.get("User-Agent"))
+    key = square_client.idempotency_key(tier_key, tier["price"], buyer)
+    # Read back by the backend's license provisioner
+    metadata = {"tier": tier_key}
+    if tier_key == "nonprofit":
+        # The nonprofit price covers NONPROFIT_MIN_USERS seats; becomes licenses.seat_limit
+        metadata["seats"] = NONPROFIT_MIN_USERS
     if buyer_email:
-        body["pre_populated_data"] = {"buyer_email": buyer_email}
-
+        metadata["buyer_email"] = buyer_email
     try:
-        resp = requests.post(
-            f"{SQUARE_BASE}/v2/online-checkout/payment-links",
-            headers=headers,
-            json=body,
-            timeout=15,
+        url = square_client.create_payment_link(
+            key=key,
+            name=f"{product_data['title']} — {tier['name']} License",
+            amount=tier["price"],
+            currency=CURRENCY,
+            redirect_url=f"{STORE_BASE_URL}/confirmation",
+            buyer_email=buyer_email or None,
+            metadata=metadata,
         )
-        data = resp.json()
-        url = data.get("payment_link", {}).get("url")
-        if resp.status_code == 200 and url:
-            return redirect(url)
-        return redirect(url_for("confirmation", status="error", reason=data.get("errors", [{}])[0].get("detail", "checkout_error")))
+        return redirect(url)
+    except square_client.SquareError as e:
+        return redirect(url_for("confirmation", status="error", reason=str(e)))
     except Exception:
         return redirect(url_for("confirmation", status="error", reason="network_error"))
 
@@ -125,32 +140,29 @@ def require_admin():
         return jsonify({"error": "unauthorized"}), 401
     return None
 
+PRODUCT_FIELDS = ("title", "description", "hero_image", "gallery_images",
+                  "details_html", "faq_html", "cookies_notice_html")
+
 @app.post("/api/admin/product")
 def update_product():
     err = require_admin()
     if err:
         return err
     
-    global PRODUCT_DATA, TIERS
     data = request.get_json() or {}
     
-    if "title" in data:
-        PRODUCT_DATA["title"] = data["title"]
-    if "description" in data:
-        PRODUCT_DATA["description"] = data["description"]
-    if "hero_image" in data:
-        PRODUCT_DATA["hero_image"] = data["hero_image"]
-    if "gallery_images" in data:
-        PRODUCT_DATA["gallery_images"] = data["gallery_images"]
-    if "details_html" in data:
-        PRODUCT_DATA["details_html"] = data["details_html"]
-    if "faq_html" in data:
-        PRODUCT_DATA["faq_html"] = data["faq_html"]
-    if "cookies_notice_html" in data:
-        PRODUCT_DATA["cookies_notice_html"] = data["cookies_notice_html"]
+    def apply(product_data):
+        for field in PRODUCT_FIELDS:
+            if field in data:
+                product_data[field] = data[field]
     
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "product": PRODUCT_DATA})
+    product_data = catalog.update(apply)
+    return jsonify({"status": "updated", "product": product_data})
+
+def _set_field(field, value_fn):
+    """Update a single catalog field; value_fn(product_data) computes the new value"""
+    product_data = catalog.update(lambda p: p.__setitem__(field, value_fn(p)))
+    return jsonify({"status": "updated", field: product_data[field]})
 
 @app.post("/api/admin/product/title")
 def update_title():
@@ -158,11 +170,8 @@ def update_title():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["title"] = data.get("value", PRODUCT_DATA["title"])
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "title": PRODUCT_DATA["title"]})
+    return _set_field("title", lambda p: data.get("value", p["title"]))
 
 @app.post("/api/admin/product/description")
 def update_description():
@@ -170,11 +179,8 @@ def update_description():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["description"] = data.get("value", PRODUCT_DATA["description"])
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "description": PRODUCT_DATA["description"]})
+    return _set_field("description", lambda p: data.get("value", p["description"]))
 
 @app.post("/api/admin/product/hero_image")
 def update_hero_image():
@@ -182,11 +188,8 @@ def update_hero_image():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["hero_image"] = data.get("url")
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "hero_image": PRODUCT_DATA["hero_image"]})
+    return _set_field("hero_image", lambda p: data.get("url"))
 
 @app.post("/api/admin/product/gallery_images")
 def update_gallery():
@@ -194,11 +197,8 @@ def update_gallery():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["gallery_images"] = data.get("images", [])
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "gallery_images": PRODUCT_DATA["gallery_images"]})
+    return _set_field("gallery_images", lambda p: data.get("images", []))
 
 @app.post("/api/admin/product/details")
 def update_details():
@@ -206,11 +206,8 @@ def update_details():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["details_html"] = data.get("html")
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "details_html": PRODUCT_DATA["details_html"]})
+    return _set_field("details_html", lambda p: data.get("html"))
 
 @app.post("/api/admin/product/faq")
 def update_faq():
@@ -218,11 +215,8 @@ def update_faq():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["faq_html"] = data.get("html")
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "faq_html": PRODUCT_DATA["faq_html"]})
+    return _set_field("faq_html", lambda p: data.get("html"))
 
 @app.post("/api/admin/product/cookies_notice")
 def update_cookies_notice():
@@ -230,11 +224,8 @@ def update_cookies_notice():
     if err:
         return err
     
-    global PRODUCT_DATA
     data = request.get_json() or {}
-    PRODUCT_DATA["cookies_notice_html"] = data.get("html")
-    save_product_data(PRODUCT_DATA)
-    return jsonify({"status": "updated", "cookies_notice_html": PRODUCT_DATA["cookies_notice_html"]})
+    return _set_field("cookies_notice_html", lambda p: data.get("html"))
 
 @app.post("/api/admin/tiers/<tier_key>")
 def update_tier(tier_key):
@@ -242,30 +233,26 @@ def update_tier(tier_key):
     if err:
         return err
     
-    global PRODUCT_DATA, TIERS
     data = request.get_json() or {}
     
-    if tier_key not in PRODUCT_DATA["tiers"]:
-        PRODUCT_DATA["tiers"][tier_key] = {}
-    
-    tier = PRODUCT_DATA["tiers"][tier_key]
-    if "name" in data:
-        tier["name"] = data["name"]
-    if "price" in data:
-        tier["price"] = int(data["price"])
-    if "description" in data:
-        tier["description"] = data["description"]
+    def apply(product_data):
+        tier = product_data["tiers"].setdefault(tier_key, {})
+        if "name" in data:
+            tier["name"] = data["name"]
+        if "price" in data:
+            tier["price"] = int(data["price"])
+        if "description" in data:
+            tier["description"] = data["description"]
     
-    save_product_data(PRODUCT_DATA)
-    TIERS = PRODUCT_DATA["tiers"]
-    return jsonify({"status": "updated", "tier": tier})
+    product_data = catalog.update(apply)
+    return jsonify({"status": "updated", "tier": product_data["tiers"][tier_key]})
 
 @app.get("/api/admin/product")
 def get_product():
     err = require_admin()
     if err:
         return err
-    return jsonify(PRODUCT_DATA)
+    return jsonify(catalog.get())
 
 @app.get("/confirmation")
 def confirmation():
@@ -0,0 +1,123 @@
+"""
+Product catalog storage shared by all gunicorn workers.
+
+The catalog is one JSON document on disk (/data/product_data.json):
+- writes take an exclusive flock, re-read the file, apply the change, bump
+  "catalog_version" and atomically replace the file (temp file + fsync + rename)
+- reads keep the parsed document in memory and only re-read it when a
+  single os.stat() shows the file was replaced, so every worker converges
+  on the next request after any worker's admin update
+- the first read writes the defaults to disk (under the flock), so workers
+  don't rebuild them and take the lock on every request before the first
+  admin update
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+_lock = threading.Lock()
+_cache = {"stamp": None, "data": None}
+
+PATH = None
+DEFAULTS = None
+
+
+def init(path: Path, defaults):
+    """Configure the catalog file and a factory for the initial document"""
+    global PATH, DEFAULTS
+    PATH = Path(path)
+    DEFAULTS = defaults
+    PATH.parent.mkdir(parents=True, exist_ok=True)
+
+
+def _stamp():
+    try:
+        st = os.stat(PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read():
+    if PATH.exists():
+        with open(PATH) as f:
+            data = json.load(f)
+    else:
+        data = DEFAULTS()
+    data.setdefault("catalog_version", 0)
+    return data
+
+
+def _write(data):
+    fd, tmp = tempfile.mkstemp(dir=PATH.parent, prefix=f".{PATH.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            os.fchmod(f.fileno(), 0o644)
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, PATH)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+@contextmanager
+def _file_lock():
+    with open(PATH.with_name(PATH.name + ".lock"), "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _write_defaults():
+    """Create the catalog file from DEFAULTS unless another worker already has; returns its stamp"""
+    try:
+        with _file_lock():
+            if not PATH.exists():
+                data = DEFAULTS()
+                data.setdefault("catalog_version", 0)
+                _write(data)
+    except OSError:
+        # Read-only volume: the defaults are served from memory instead
+        pass
+    return _stamp()
+
+
+def get():
+    """Current catalog document (shared; do not mutate)"""
+    stamp = _stamp()
+    if _cache["data"] is None or stamp != _cache["stamp"]:
+        with _lock:
+            stamp = _stamp()
+            if stamp is None:
+                stamp = _write_defaults()
+            if _cache["data"] is None or stamp != _cache["stamp"]:
+                _cache["data"] = _read()
+                _cache["stamp"] = stamp
+    return _cache["data"]
+
+
+def version() -> int:
+    return get()["catalog_version"]
+
+
+def update(mutate):
+    """
+    Apply mutate(doc) to the latest on-disk catalog under an exclusive lock,
+    bump catalog_version and persist atomically. Returns the new document.
+    """
+    with _lock, _file_lock():
+        data = _read()
+        mutate(data)
+        data["catalog_version"] = data.get("catalog_version", 0) + 1
+        _write(data)
+        _cache["data"] = data
+        _cache["stamp"] = _stamp()
+        return data
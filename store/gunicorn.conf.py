@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for the store (loaded automatically from the working directory).
+"""
+import os
+import shutil
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+
+# Per-worker metric files, aggregated by /metrics (see metrics.py). Must be
+# set before the workers import prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+
+# Imported up front: child_exit runs from the master's SIGCHLD handler and
+# can re-enter itself, which breaks a first import made there
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    # Samples from a previous run must not be summed into this one
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,66 @@
+"""
+Prometheus metrics for the store, served at /metrics.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so every
+worker writes its samples to shared mmap files and /metrics aggregates them.
+"""
+import hmac
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+MULTIPROC = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ["route", "method"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter("http_requests_total", "HTTP requests by status", ["route", "method", "status"])
+SQUARE_LATENCY = Histogram(
+    "square_request_duration_seconds", "Square API call latency",
+    ["endpoint"],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+SQUARE_REQUESTS = Counter("square_requests_total", "Square API calls by outcome", ["endpoint", "outcome"])
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result", ["cache", "result"])
+
+
+def cache_result(cache: str, result: str):
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def init_app(app):
+    """Time every request and serve /metrics"""
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None and request.endpoint != "metrics":
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - start)
+            REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        return response
+
+    def metrics():
+        if METRICS_TOKEN:
+            token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+            if not hmac.compare_digest(token.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+                return ("unauthorized", 401)
+        if MULTIPROC:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule("/metrics", "metrics", metrics)
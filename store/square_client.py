@@ -0,0 +1,136 @@
+"""
+Square Checkout API client for the store.
+
+- one pooled keep-alive requests.Session per worker (no TLS handshake per checkout)
+- deterministic idempotency keys per (tier, price, buyer, time window), so a
+  double-click or refresh gets the same payment link back from Square instead
+  of creating a new one
+- a short-TTL in-process cache of generated links, so repeats within the
+  window skip the outbound call entirely
+
+Point SQUARE_BASE at square_stub.py to run checkout locally without Square.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import SQUARE_LATENCY, SQUARE_REQUESTS, cache_result
+
+SQUARE_ACCESS_TOKEN = os.environ.get("SQUARE_ACCESS_TOKEN")
+SQUARE_LOCATION_ID  = os.environ.get("SQUARE_LOCATION_ID")
+SQUARE_BASE         = os.environ.get("SQUARE_BASE", "https://connect.squareup.com")
+SQUARE_VERSION      = os.environ.get("SQUARE_VERSION", "2024-09-26")
+
+LINK_WINDOW_SEC = int(os.environ.get("SQUARE_LINK_WINDOW_SEC", "600"))
+TIMEOUT = (3.05, 10)  # connect, read
+
+_IDEMPOTENCY_NS = uuid.UUID("6f1c1f4e-5b7d-4b8e-9a53-2d1f6c0b7a11")
+
+_session = None
+_session_lock = threading.Lock()
+_links = {}  # idempotency key -> (expires_at, url)
+_links_lock = threading.Lock()
+
+
+class SquareError(Exception):
+    pass
+
+
+def configured() -> bool:
+    return bool(SQUARE_ACCESS_TOKEN and SQUARE_LOCATION_ID)
+
+
+def session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                # Retrying POSTs is safe: every request carries an idempotency key
+                retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2,
+                              allowed_methods=None)
+                s.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry))
+                s.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry))
+                s.headers.update({
+                    "Authorization": f"Bearer {SQUARE_ACCESS_TOKEN}",
+                    "Content-Type": "application/json",
+                    "Square-Version": SQUARE_VERSION,
+                })
+                _session = s
+    return _session
+
+
+def idempotency_key(tier_key: str, price: int, buyer: str, now: float | None = None) -> str:
+    """Same buyer + tier + price within one LINK_WINDOW_SEC window -> same key"""
+    window = int((now or time.time()) // LINK_WINDOW_SEC)
+    return str(uuid.uuid5(_IDEMPOTENCY_NS, f"{tier_key}|{price}|{buyer.lower()}|{window}"))
+
+
+def buyer_fingerprint(buyer_email: str, remote_addr: str | None, user_agent: str | None) -> str:
+    """Identify the buyer for idempotency; anonymous buyers are told apart by client"""
+    if buyer_email:
+        return buyer_email.strip().lower()
+    raw = f"{remote_addr or ''}|{user_agent or ''}"
+    return "anon:" + hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def create_payment_link(*, key: str, name: str, amount: int, currency: str,
+                        redirect_url: str, buyer_email: str | None = None,
+                        metadata: dict | None = None) -> str:
+    """Return a payment link URL, reusing one created for the same key"""
+    now = time.monotonic()
+    cached = _links.get(key)
+    if cached and cached[0] > now:
+        cache_result("payment_link", "hit")
+        return cached[1]
+    cache_result("payment_link", "miss")
+
+    body = {
+        "idempotency_key": key,
+        "order": {
+            "location_id": SQUARE_LOCATION_ID,
+            "line_items": [
+                {
+                    "name": name,
+                    "quantity": "1",
+                    "base_price_money": {"amount": amount, "currency": currency},
+                }
+            ],
+        },
+        "checkout_options": {
+            "redirect_url": redirect_url,
+            "ask_for_shipping_address": False,
+            "enable_guest_checkout": True,
+        },
+    }
+    if metadata:
+        body["order"]["metadata"] = {k: str(v) for k, v in metadata.items()}
+    if buyer_email:
+        body["pre_populated_data"] = {"buyer_email": buyer_email}
+
+    start = time.perf_counter()
+    try:
+        resp = session().post(f"{SQUARE_BASE}/v2/online-checkout/payment-links", json=body, timeout=TIMEOUT)
+    except Exception:
+        SQUARE_REQUESTS.labels("payment-links", "network_error").inc()
+        raise
+    finally:
+        SQUARE_LATENCY.labels("payment-links").observe(time.perf_counter() - start)
+    SQUARE_REQUESTS.labels("payment-links", "ok" if resp.status_code == 200 else "http_error").inc()
+    data = resp.json()
+    url = data.get("payment_link", {}).get("url")
+    if resp.status_code != 200 or not url:
+        raise SquareError(data.get("errors", [{}])[0].get("detail", "checkout_error"))
+
+    with _links_lock:
+        # Drop expired entries while we hold the lock
+        for k in [k for k, (exp, _) in _links.items() if exp <= now]:
+            del _links[k]
+        _links[key] = (now + LINK_WINDOW_SEC, url)
+    return url
@@ -0,0 +1,96 @@
+"""
+Local stand-in for the Square API, for development and tests.
+
+Implements the endpoints the store uses, including Square's idempotency
+behaviour (same idempotency_key -> same response):
+
+    POST /v2/online-checkout/payment-links
+    POST /v2/orders/batch-retrieve
+
+Run it and point the store at it:
+    python square_stub.py                      # listens on :8099
+    SQUARE_BASE=http://localhost:8099 SQUARE_ACCESS_TOKEN=test SQUARE_LOCATION_ID=LOC flask run
+"""
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_by_idempotency_key = {}
+ORDERS = {}
+STATS = {"payment_links_created": 0, "requests": 0}
+
+
+def _error(status, detail, code="BAD_REQUEST"):
+    return jsonify({"errors": [{"category": "INVALID_REQUEST_ERROR", "code": code, "detail": detail}]}), status
+
+
+@app.before_request
+def _auth():
+    if request.path.startswith("/_stub/"):
+        return None
+    STATS["requests"] += 1
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        return _error(401, "missing bearer token", "UNAUTHORIZED")
+
+
+@app.post("/v2/online-checkout/payment-links")
+def create_payment_link():
+    body = request.get_json(force=True)
+    key = body.get("idempotency_key")
+    if not key:
+        return _error(400, "idempotency_key is required")
+    order = body.get("order") or {}
+    if not order.get("location_id") or not order.get("line_items"):
+        return _error(400, "order.location_id and order.line_items are required")
+
+    with _lock:
+        if key in _by_idempotency_key:
+            return jsonify(_by_idempotency_key[key])
+        order_id = uuid.uuid4().hex[:24].upper()
+        link_id = uuid.uuid4().hex[:16].upper()
+        total = sum(int(li["base_price_money"]["amount"]) * int(li.get("quantity", "1")) for li in order["line_items"])
+        ORDERS[order_id] = {
+            "id": order_id,
+            "location_id": order["location_id"],
+            "line_items": order["line_items"],
+            "metadata": order.get("metadata", {}),
+            "total_money": {"amount": total, "currency": order["line_items"][0]["base_price_money"]["currency"]},
+            "state": "OPEN",
+        }
+        response = {
+            "payment_link": {
+                "id": link_id,
+                "version": 1,
+                "order_id": order_id,
+                "url": f"{request.host_url.rstrip('/')}/pay/{link_id}",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            },
+            "related_resources": {"orders": [ORDERS[order_id]]},
+        }
+        _by_idempotency_key[key] = response
+        STATS["payment_links_created"] += 1
+        return jsonify(response)
+
+
+@app.post("/v2/orders/batch-retrieve")
+def batch_retrieve_orders():
+    body = request.get_json(force=True)
+    ids = body.get("order_ids") or []
+    if len(ids) > 100:
+        return _error(400, "at most 100 order_ids")
+    return jsonify({"orders": [ORDERS[i] for i in ids if i in ORDERS]})
+
+
+@app.get("/_stub/stats")
+def stats():
+    return jsonify(STATS)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8099")), threaded=True)